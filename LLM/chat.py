@@ -1,25 +1,79 @@
+from collections import deque
+
+
 class Chat:
     """
-    Handles the chat using to avoid OOM issues.
+    Handles the chat history, trimmed by number of interactions and by token count to bound the prompt length.
+    The token count of each message is computed once, when it is added, with `count_tokens`. It covers the message
+    contents only, not the tokens added by the chat template.
     """
 
-    def __init__(self, size):
+    def __init__(self, size, max_tokens=None, count_tokens=None, keep_evicted=False):
         self.size = size
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or (lambda content: len(content.split()))
         self.init_chat_message = None
-        # maxlen is necessary pair, since a each new step we add an prompt and assitant answer
-        self.buffer = []
+        self.init_chat_tokens = 0
+        # messages summarizing interactions that were dropped from the buffer
+        self.memory = []
+        self.memory_tokens = 0
+        # (message, number of tokens) pairs, a user prompt always comes with the following assistant answer
+        self.buffer = deque()
+        self.buffer_tokens = 0
+        # dropped messages waiting to be summarized into the memory
+        self.keep_evicted = keep_evicted
+        self.evicted = []
 
     def append(self, item):
-        self.buffer.append(item)
-        if len(self.buffer) == 2 * (self.size + 1):
-            self.buffer.pop(0)
-            self.buffer.pop(0)
+        nb_tokens = self.count_tokens(item["content"])
+        self.buffer.append((item, nb_tokens))
+        self.buffer_tokens += nb_tokens
+
+        if self.size is not None and len(self.buffer) == 2 * (self.size + 1):
+            self.evict(self.pop_interaction())
+        if self.max_tokens is not None:
+            # always keep the last interaction, even if it is over budget on its own
+            while self.prompt_length > self.max_tokens and len(self.buffer) > 2:
+                self.evict(self.pop_interaction())
+
+    def evict(self, messages):
+        if self.keep_evicted:
+            self.evicted.extend(messages)
+
+    def pop_interaction(self):
+        """
+        Removes the oldest user prompt and assistant answer, and returns them.
+        """
+        messages = []
+        for _ in range(2):
+            message, nb_tokens = self.buffer.popleft()
+            self.buffer_tokens -= nb_tokens
+            messages.append(message)
+        return messages
 
     def init_chat(self, init_chat_message):
         self.init_chat_message = init_chat_message
+        self.init_chat_tokens = self.count_tokens(init_chat_message["content"])
+
+    def set_memory(self, messages, nb_evicted):
+        """
+        Replaces the memory with `messages`, which summarize the previous memory and the first `nb_evicted` evicted
+        messages.
+        """
+        self.memory = messages
+        self.memory_tokens = sum(self.count_tokens(m["content"]) for m in messages)
+        del self.evicted[:nb_evicted]
+
+    @property
+    def prompt_length(self):
+        """
+        Number of tokens of the messages currently in the chat.
+        """
+        return self.init_chat_tokens + self.memory_tokens + self.buffer_tokens
 
     def to_list(self):
+        messages = self.memory + [message for message, _ in self.buffer]
         if self.init_chat_message:
-            return [self.init_chat_message] + self.buffer
+            return [self.init_chat_message] + messages
         else:
-            return self.buffer
+            return messages
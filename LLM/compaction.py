@@ -0,0 +1,59 @@
+import torch
+from transformers import StoppingCriteria
+
+
+class PreemptionCriteria(StoppingCriteria):
+    """
+    Stops generation as soon as `is_preempted` returns True, e.g. when a new user utterance needs the model.
+    """
+
+    def __init__(self, is_preempted):
+        self.is_preempted = is_preempted
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],),
+            self.is_preempted(),
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
+
+def summary_request(memory, evicted, user_role, max_words=60):
+    """
+    Builds the chat asking the model to fold the current memory and the evicted messages into a short summary.
+    """
+    lines = []
+    if memory:
+        lines.append(f"Summary of the earlier conversation: {memory_summary(memory)}")
+    for message in evicted:
+        speaker = "Assistant" if message["role"] == "assistant" else "User"
+        lines.append(f"{speaker}: {message['content']}")
+    transcript = "\n".join(lines)
+    return [
+        {
+            "role": user_role,
+            "content": (
+                f"Summarize the following conversation between a user and an assistant in at most {max_words} words. "
+                "Keep the facts, names and requests the assistant may need later. Only answer with the summary.\n\n"
+                f"{transcript}"
+            ),
+        }
+    ]
+
+
+MEMORY_PREFIX = "Here is a summary of our earlier conversation: "
+
+
+def memory_messages(summary, user_role):
+    """
+    Wraps a summary into a user prompt and assistant answer, which every chat template accepts.
+    """
+    return [
+        {"role": user_role, "content": f"{MEMORY_PREFIX}{summary}"},
+        {"role": "assistant", "content": "Thanks, I will keep it in mind."},
+    ]
+
+
+def memory_summary(memory):
+    return memory[0]["content"][len(MEMORY_PREFIX) :]
@@ -0,0 +1,171 @@
+import logging
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+
+import torch
+from transformers import DynamicCache
+
+logger = logging.getLogger(__name__)
+
+
+def common_prefix_length(a, b):
+    """
+    Number of leading tokens shared by two 1D tensors of token ids.
+    """
+    length = min(len(a), len(b))
+    mismatches = (a[:length] != b[:length]).nonzero()
+    return mismatches[0].item() if len(mismatches) else length
+
+
+def cache_tensors(cache):
+    """
+    Keys and values of all the layers of a `DynamicCache`.
+    """
+    if hasattr(cache, "layers"):
+        # newer transformers versions deprecate, then remove, key_cache and value_cache in favor of the layers
+        return [
+            tensor
+            for layer in cache.layers
+            for tensor in (layer.keys, layer.values)
+            if tensor is not None
+        ]
+    return [*cache.key_cache, *cache.value_cache]
+
+
+def cache_nbytes(cache):
+    """
+    Memory used by the keys and values of a `DynamicCache`.
+    """
+    return sum(tensor.numel() * tensor.element_size() for tensor in cache_tensors(cache))
+
+
+class PrefixCache:
+    """
+    KV states of prompt prefixes common to every conversation, such as the system prompt, computed once by a handler.
+    A handler serves a single chat, whose `SessionKVCache` already covers the prefix after its first turn: with turn
+    reuse, only the prefill of the first turn is saved, without it, the prefill of the prefix is saved on every turn.
+
+    Entries are keyed by their token ids and never modified: lookups hand out a copy that generation can extend. The
+    least recently used entries are evicted once the stored states exceed `max_memory_mb`.
+    """
+
+    def __init__(self, max_memory_mb=256):
+        self.max_nbytes = int(max_memory_mb * 2**20)
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @torch.no_grad()
+    def add(self, model, token_ids):
+        """
+        Computes and stores the KV states of `token_ids`, a 1D tensor of token ids.
+        """
+        key = tuple(token_ids.tolist())
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+
+        cache = DynamicCache()
+        model(input_ids=token_ids[None], past_key_values=cache, use_cache=True)
+        nbytes = cache_nbytes(cache)
+        if nbytes > self.max_nbytes:
+            logger.warning(
+                f"Prefix of {len(key)} tokens needs {nbytes / 2**20:.1f} MB, more than the prefix cache budget. Not caching it."
+            )
+            return
+
+        with self.lock:
+            self.entries[key] = (cache, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_nbytes:
+                _, (_, evicted_nbytes) = self.entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+        logger.debug(f"Cached KV states of a {len(key)} tokens prefix")
+
+    def lookup(self, input_ids):
+        """
+        Returns the length of the longest stored prefix of `input_ids` and a copy of its cache, leaving at least one
+        token of `input_ids` uncached.
+        """
+        token_ids = tuple(input_ids[0].tolist())
+        best_key = None
+        with self.lock:
+            for key in self.entries:
+                if (
+                    len(key) < len(token_ids)
+                    and (best_key is None or len(key) > len(best_key))
+                    and token_ids[: len(key)] == key
+                ):
+                    best_key = key
+            if best_key is None:
+                return 0, None
+            self.entries.move_to_end(best_key)
+            cache, _ = self.entries[best_key]
+        return len(best_key), deepcopy(cache)
+
+
+class SessionKVCache:
+    """
+    Keeps the KV cache of the previous turn of a conversation so that a new turn only prefills the tokens it adds.
+
+    The cache is matched against the new prompt token by token and cropped to the longest common prefix, so edits to
+    the history, e.g. when `Chat` drops its oldest turns, only discard the part of the cache that no longer matches.
+    When a shared `PrefixCache` covers more of the new prompt, a copy of its entry is used instead.
+    """
+
+    def __init__(self, reuse_turns=True, prefix_cache=None):
+        self.reuse_turns = reuse_turns
+        self.prefix_cache = prefix_cache
+        self.clear()
+
+    def clear(self):
+        self.cache = None
+        self.token_ids = None
+
+    def prepare(self, input_ids):
+        """
+        Returns the cache to pass to `generate` for `input_ids`. Ownership of the cache moves to the caller until
+        `update` is called with the generation outputs.
+        """
+        cache, token_ids = self.cache, self.token_ids
+        self.clear()
+
+        length = 0
+        if cache is not None and self.reuse_turns:
+            # generate needs at least one uncached token to compute the next token logits
+            length = min(
+                common_prefix_length(token_ids, input_ids[0].to(token_ids.device)),
+                input_ids.shape[-1] - 1,
+            )
+
+        if self.prefix_cache is not None:
+            prefix_length, prefix = self.prefix_cache.lookup(input_ids)
+            if prefix_length > length:
+                length, cache = prefix_length, prefix
+
+        logger.debug(f"Reusing {length} cached tokens out of {input_ids.shape[-1]}")
+        if length == 0:
+            return DynamicCache()
+        cache.crop(length)
+        return cache
+
+    def update(self, cache, sequences):
+        """
+        Stores the cache returned by `generate` along with the token ids its keys and values were computed for.
+        """
+        # the last generated token is never fed back to the model
+        self.token_ids = sequences[0, : cache.get_seq_length()]
+        self.cache = cache
+
+
+@torch.no_grad()
+def generate_with_cache(model, kv_cache, **kwargs):
+    """
+    Runs `model.generate` on top of `kv_cache` and stores the resulting cache for the next turn.
+    """
+    kwargs["past_key_values"] = kv_cache.prepare(kwargs["input_ids"])
+    outputs = model.generate(return_dict_in_generate=True, **kwargs)
+    kv_cache.update(outputs.past_key_values, outputs.sequences)
+    return outputs
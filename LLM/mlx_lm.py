@@ -1,5 +1,6 @@
 import logging
 from LLM.chat import Chat
+from LLM.sentence_segmenter import build_text_chunker
 from baseHandler import BaseHandler
 from mlx_lm import load, stream_generate, generate
 from rich.console import Console
@@ -26,14 +27,24 @@ class MLXLanguageModelHandler(BaseHandler):
         gen_kwargs={},
         user_role="user",
         chat_size=1,
+        chat_max_tokens=None,
         init_chat_role=None,
         init_chat_prompt="You are a helpful AI assistant.",
+        chunking_policy="sentence",
+        first_chunk_min_words=4,
+        first_chunk_max_words=12,
+        chunk_growth_factor=2.0,
+        max_chunk_words=48,
     ):
         self.model_name = model_name
         self.model, self.tokenizer = load(self.model_name)
         self.gen_kwargs = gen_kwargs
 
-        self.chat = Chat(chat_size)
+        self.chat = Chat(
+            chat_size,
+            max_tokens=chat_max_tokens,
+            count_tokens=lambda text: len(self.tokenizer.encode(text)),
+        )
         if init_chat_role:
             if not init_chat_prompt:
                 raise ValueError(
@@ -41,6 +52,13 @@ class MLXLanguageModelHandler(BaseHandler):
                 )
             self.chat.init_chat({"role": init_chat_role, "content": init_chat_prompt})
         self.user_role = user_role
+        self.text_chunker = build_text_chunker(
+            chunking_policy,
+            first_chunk_min_words=first_chunk_min_words,
+            first_chunk_max_words=first_chunk_max_words,
+            chunk_growth_factor=chunk_growth_factor,
+            max_chunk_words=max_chunk_words,
+        )
 
         self.warmup()
 
@@ -77,19 +95,24 @@ class MLXLanguageModelHandler(BaseHandler):
             chat_messages, tokenize=False, add_generation_prompt=True
         )
         output = ""
-        curr_output = ""
+        nb_sentences = 0
         for t in stream_generate(
             self.model,
             self.tokenizer,
             prompt,
             max_tokens=self.gen_kwargs["max_new_tokens"],
         ):
+            t = t.replace("<|end|>", "")
             output += t
-            curr_output += t
-            if curr_output.endswith((".", "?", "!", "<|end|>")):
-                yield curr_output.replace("<|end|>", "")
-                curr_output = ""
-        generated_text = output.replace("<|end|>", "")
+            for sentence in self.text_chunker.push(t):
+                nb_sentences += 1
+                yield sentence
+        generated_text = output
         torch.mps.empty_cache()
 
         self.chat.append({"role": "assistant", "content": generated_text})
+
+        # don't forget last sentence, the TTS needs at least one input per turn to start listening again
+        printable_text = self.text_chunker.flush()
+        if printable_text or nb_sentences == 0:
+            yield printable_text
@@ -0,0 +1,251 @@
+ABBREVIATIONS = {
+    "mr",
+    "mrs",
+    "ms",
+    "dr",
+    "prof",
+    "sr",
+    "jr",
+    "st",
+    "mt",
+    "vs",
+    "etc",
+    "e.g",
+    "i.e",
+    "cf",
+    "al",
+    "approx",
+    "dept",
+    "est",
+    "fig",
+    "inc",
+    "ltd",
+    "co",
+    "corp",
+    "no",
+    "vol",
+    "u.s",
+    "u.k",
+    "a.m",
+    "p.m",
+    "jan",
+    "feb",
+    "mar",
+    "apr",
+    "jun",
+    "jul",
+    "aug",
+    "sep",
+    "sept",
+    "oct",
+    "nov",
+    "dec",
+}
+
+TERMINATORS = ".!?"
+CLOSERS = "\"')]}”’"
+OPENERS = "\"'([{“‘"
+
+
+class SentenceSegmenter:
+    """
+    Incremental sentence boundary detector for streamed language model output.
+
+    Text is pushed as it is generated and complete sentences are returned as soon as their boundary is confirmed by
+    the following whitespace. Each character is scanned exactly once, so the cost per streamed token does not depend
+    on the length of the response. Abbreviations ("Dr.", "e.g."), initials ("J. Smith"), decimals ("3.14") and list
+    markers ("1. ") are not treated as sentence ends.
+    """
+
+    def __init__(self, abbreviations=ABBREVIATIONS):
+        self.abbreviations = abbreviations
+        self.reset()
+
+    def reset(self):
+        # pieces of the sentence being built, the last one may still grow
+        self._pieces = []
+        # characters of the word being scanned
+        self._word = []
+        self._nb_words = 0
+        # a terminator run ending the current word, waiting for whitespace to be confirmed
+        self._pending = False
+        self._terminated_word = ""
+        self._terminators = ""
+
+    def push(self, text):
+        """
+        Appends `text` and returns the list of sentences completed by it.
+        """
+        sentences = []
+        start = 0
+        for i, char in enumerate(text):
+            if self._pending:
+                if char.isspace():
+                    self._pending = False
+                    if self._is_boundary():
+                        self._pieces.append(text[start:i])
+                        sentence = "".join(self._pieces).strip()
+                        if sentence:
+                            sentences.append(sentence)
+                        self._pieces = []
+                        self._word = []
+                        self._nb_words = 0
+                        start = i
+                elif char in TERMINATORS:
+                    self._terminators += char
+                elif char not in CLOSERS:
+                    # "3.14", "e.g" or "U.S": the terminator was inside a word
+                    self._pending = False
+
+            if char.isspace():
+                if self._word:
+                    self._nb_words += 1
+                self._word = []
+                continue
+            if char in TERMINATORS and not self._pending:
+                self._pending = True
+                self._terminated_word = "".join(self._word)
+                self._terminators = char
+            self._word.append(char)
+
+        self._pieces.append(text[start:])
+        return sentences
+
+    def flush(self):
+        """
+        Returns whatever text is left once generation is over and resets the segmenter.
+        """
+        sentence = "".join(self._pieces).strip()
+        self.reset()
+        return sentence
+
+    def _is_boundary(self):
+        if "!" in self._terminators or "?" in self._terminators:
+            return True
+
+        word = self._terminated_word.lstrip(OPENERS)
+        if not word:
+            # ellipsis or stray punctuation
+            return True
+        if word.lower() in self.abbreviations:
+            return False
+        if len(word) == 1 and word.isupper() and word not in ("I", "A"):
+            # initials, e.g. "J. Smith"
+            return False
+        if word.isdigit() and self._nb_words == 0:
+            # list marker at the start of a sentence, e.g. "1. Preheat the oven"
+            return False
+        return True
+
+
+CLAUSE_PUNCTUATION = ",;:—"
+
+
+class ChunkingPolicy:
+    """
+    Latency-aware grouping of streamed text into TTS inputs.
+
+    The first chunk of a reply is cut early, at the first clause boundary once `first_chunk_min_words` words are
+    available or at a word boundary after `first_chunk_max_words` words, so that speech starts before the first
+    sentence is complete. Later chunks are made of whole sentences and grow geometrically by `growth_factor` up to
+    `max_chunk_words`, since by then audio is already playing and longer inputs give better prosody.
+    """
+
+    def __init__(
+        self,
+        first_chunk_min_words=4,
+        first_chunk_max_words=12,
+        growth_factor=2.0,
+        max_chunk_words=48,
+    ):
+        self.first_chunk_min_words = first_chunk_min_words
+        self.first_chunk_max_words = first_chunk_max_words
+        self.growth_factor = growth_factor
+        self.max_chunk_words = max_chunk_words
+        self.segmenter = SentenceSegmenter()
+        self.reset()
+
+    def reset(self):
+        self.segmenter.reset()
+        self._nb_chunks = 0
+        self._sentences = []
+        self._nb_words = 0
+        # word tracking used to cut the first chunk
+        self._first_chunk_words = 0
+        self._last_char = " "
+
+    @property
+    def target_words(self):
+        target = self.first_chunk_max_words * self.growth_factor ** self._nb_chunks
+        return min(self.max_chunk_words, int(target))
+
+    def push(self, text):
+        """
+        Appends `text` and returns the list of chunks ready to be synthesized.
+        """
+        if self._nb_chunks > 0:
+            return self._collect(self.segmenter.push(text))
+
+        chunks = []
+        for i, char in enumerate(text):
+            chunks += self._collect(self.segmenter.push(char))
+            if self._nb_chunks > 0:
+                # the first chunk ended on a sentence boundary
+                return chunks + self._collect(self.segmenter.push(text[i + 1 :]))
+
+            if char.isspace() and not self._last_char.isspace():
+                self._first_chunk_words += 1
+                at_clause = self._last_char in CLAUSE_PUNCTUATION
+                if (
+                    at_clause and self._first_chunk_words >= self.first_chunk_min_words
+                ) or self._first_chunk_words >= self.first_chunk_max_words:
+                    chunks.append(self.segmenter.flush())
+                    self._nb_chunks += 1
+                    return chunks + self._collect(self.segmenter.push(text[i + 1 :]))
+            self._last_char = char
+        return chunks
+
+    def flush(self):
+        """
+        Returns whatever text is left once generation is over and resets the policy.
+        """
+        remainder = self.segmenter.flush()
+        chunk = " ".join(self._sentences + ([remainder] if remainder else []))
+        self.reset()
+        return chunk
+
+    def _collect(self, sentences):
+        chunks = []
+        for sentence in sentences:
+            self._sentences.append(sentence)
+            self._nb_words += len(sentence.split())
+            if self._nb_chunks == 0 or self._nb_words >= self.target_words:
+                chunks.append(" ".join(self._sentences))
+                self._sentences = []
+                self._nb_words = 0
+                self._nb_chunks += 1
+        return chunks
+
+
+def build_text_chunker(
+    chunking_policy="sentence",
+    first_chunk_min_words=4,
+    first_chunk_max_words=12,
+    chunk_growth_factor=2.0,
+    max_chunk_words=48,
+):
+    """
+    Returns the object splitting streamed LLM output into TTS inputs for the given policy.
+    """
+    if chunking_policy == "sentence":
+        return SentenceSegmenter()
+    if chunking_policy == "adaptive":
+        return ChunkingPolicy(
+            first_chunk_min_words=first_chunk_min_words,
+            first_chunk_max_words=first_chunk_max_words,
+            growth_factor=chunk_growth_factor,
+            max_chunk_words=max_chunk_words,
+        )
+    raise ValueError(
+        f"Unknown chunking policy {chunking_policy}, should be either 'sentence' or 'adaptive'."
+    )
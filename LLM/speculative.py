@@ -0,0 +1,72 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def check_assistant_tokenizer(tokenizer, assistant_tokenizer, assistant_model_name):
+    """
+    Raises a ValueError unless the draft model tokenizes like the main model: assisted generation passes token ids from
+    one model to the other as is, and fails deep inside `generate`, or decodes garbage, when they differ.
+    """
+    if len(assistant_tokenizer) != len(tokenizer):
+        raise ValueError(
+            f"The assistant model {assistant_model_name} has a vocabulary of {len(assistant_tokenizer)} tokens, "
+            f"the language model of {len(tokenizer)}. Speculative decoding needs models sharing their tokenizer"
+        )
+    special_tokens = dict(zip(tokenizer.all_special_tokens, tokenizer.all_special_ids))
+    assistant_special_tokens = dict(
+        zip(assistant_tokenizer.all_special_tokens, assistant_tokenizer.all_special_ids)
+    )
+    if assistant_special_tokens != special_tokens:
+        raise ValueError(
+            f"The assistant model {assistant_model_name} has special tokens {assistant_special_tokens}, "
+            f"the language model {special_tokens}. Speculative decoding needs models sharing their tokenizer"
+        )
+    if assistant_tokenizer.get_vocab() != tokenizer.get_vocab():
+        raise ValueError(
+            f"The assistant model {assistant_model_name} maps tokens to different ids than the language model. "
+            "Speculative decoding needs models sharing their tokenizer"
+        )
+
+
+class AcceptanceTracker:
+    """
+    Measures how many draft tokens the main model accepts during assisted generation.
+
+    Each forward pass of the draft model proposes one token, and each forward pass of the main model verifies the
+    pending proposals and adds one token of its own. Counting forward passes of both models is therefore enough to
+    derive the acceptance rate without changing the decoding loop.
+    """
+
+    def __init__(self, model, assistant_model):
+        self.total_drafted = 0
+        self.total_accepted = 0
+        self.reset()
+        model.register_forward_hook(self._count_main)
+        assistant_model.register_forward_hook(self._count_draft)
+
+    def reset(self):
+        self.main_calls = 0
+        self.draft_calls = 0
+
+    def _count_main(self, module, args, output):
+        self.main_calls += 1
+
+    def _count_draft(self, module, args, output):
+        self.draft_calls += 1
+
+    def report(self, nb_new_tokens):
+        """
+        Logs the acceptance rate of the generation of `nb_new_tokens` tokens since the last call, and resets counts.
+        """
+        accepted = max(nb_new_tokens - self.main_calls, 0)
+        drafted = self.draft_calls
+        self.total_accepted += accepted
+        self.total_drafted += drafted
+        if drafted:
+            logger.info(
+                f"Speculative decoding: {accepted}/{drafted} draft tokens accepted ({accepted / drafted:.0%}), "
+                f"{nb_new_tokens / max(self.main_calls, 1):.2f} tokens per forward pass, "
+                f"overall acceptance {self.total_accepted / self.total_drafted:.0%}"
+            )
+        self.reset()
@@ -1,6 +1,7 @@
 import logging
 from time import perf_counter
 from baseHandler import BaseHandler
+from STT.streaming import PartialUtterance
 from lightning_whisper_mlx import LightningWhisperMLX
 import numpy as np
 from rich.console import Console
@@ -21,10 +22,16 @@ class LightningWhisperSTTHandler(BaseHandler):
 
     def setup(
         self,
+        turn_hint=None,
         model_name="distil-large-v3",
         device="cuda",
         torch_dtype="float16",
         compile_mode=None,
+        quantization=None,
+        window_overlap_s=5.0,
+        max_batch_size=8,
+        budget_tokens_per_s=8.0,
+        budget_base_tokens=16,
         gen_kwargs={},
     ):
         if len(model_name.split("/")) > 1:
@@ -44,6 +51,10 @@ class LightningWhisperSTTHandler(BaseHandler):
             _ = self.model.transcribe(dummy_input)["text"].strip()
 
     def process(self, spoken_prompt):
+        if isinstance(spoken_prompt, PartialUtterance):
+            # partial transcription is not supported, only final utterances are transcribed
+            return
+
         logger.debug("infering whisper...")
 
         global pipeline_start
@@ -0,0 +1,54 @@
+import string
+
+
+def split_windows(audio, window_samples, overlap_samples):
+    """
+    Splits `audio` into windows of `window_samples` samples, each overlapping the previous one by `overlap_samples`.
+    The last window ends with the audio and may be shorter.
+    """
+    stride = window_samples - overlap_samples
+    assert stride > 0, "windows should overlap by less than their length"
+    windows = []
+    start = 0
+    while True:
+        windows.append(audio[start : start + window_samples])
+        if start + window_samples >= len(audio):
+            return windows
+        start += stride
+
+
+def normalize_word(word):
+    return word.strip(string.punctuation).lower()
+
+
+def merge_words(left, right):
+    """
+    Joins the words of two consecutive windows, dropping the words both transcribed in their overlap.
+
+    The overlap is the alignment of a suffix of `left` with a prefix of `right` with the most matching words, among
+    the ones where at least half of the words match. Words of the overlap are taken from `left` for its first half and
+    from `right` for its second half, where each window has more context.
+    """
+    normalized_left = [normalize_word(word) for word in left]
+    normalized_right = [normalize_word(word) for word in right]
+    best_length, best_matches = 0, 0
+    for length in range(1, min(len(left), len(right)) + 1):
+        matches = sum(
+            a == b
+            for a, b in zip(normalized_left[-length:], normalized_right[:length])
+        )
+        if 2 * matches >= length and matches > best_matches:
+            best_length, best_matches = length, matches
+
+    half = best_length // 2
+    return left[: len(left) - best_length + half] + right[half:]
+
+
+def merge_transcripts(texts):
+    """
+    Merges the transcriptions of overlapping windows, in order, into the transcription of the whole audio.
+    """
+    words = []
+    for text in texts:
+        words = merge_words(words, text.split())
+    return " ".join(words)
@@ -0,0 +1,50 @@
+class PartialUtterance:
+    """
+    Speech buffered so far by the VAD for an utterance that is still going on, sent to the STT for partial
+    transcription. `utterance_id` changes with every utterance, including the ones the VAD ends up discarding, for
+    which a last `PartialUtterance` with no audio is sent.
+
+    A `tentative` one is sent when the user pauses, with the whole utterance so far: its transcription is kept and
+    becomes the final one if the pause turns out to be the end of the turn. Any later non tentative `PartialUtterance`
+    of the utterance means that the user went on speaking, and discards it.
+    """
+
+    def __init__(self, audio, utterance_id, tentative=False):
+        self.audio = audio
+        self.utterance_id = utterance_id
+        self.tentative = tentative
+
+
+class LocalAgreement:
+    """
+    Stabilizes the transcription of a growing utterance: words on which two consecutive partial hypotheses agree are
+    committed, and are never revised afterwards. Hypotheses are expected to start with the committed words, which is
+    the case when the committed text is forced as the start of decoding.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, utterance_id=None):
+        self.utterance_id = utterance_id
+        self.committed = []
+        self.previous = []
+
+    def update(self, text):
+        """
+        Adds a hypothesis for the whole utterance and returns the number of newly committed words.
+        """
+        words = text.split()
+        nb_committed = len(self.committed)
+        for previous_word, word in zip(
+            self.previous[nb_committed:], words[nb_committed:]
+        ):
+            if previous_word != word:
+                break
+            self.committed.append(word)
+        self.previous = words
+        return len(self.committed) - nb_committed
+
+    @property
+    def committed_text(self):
+        return " ".join(self.committed)
@@ -0,0 +1,63 @@
+import torch
+
+
+class WhisperLogMel:
+    """
+    Computes Whisper log-mel input features with torch, on the device of the model.
+
+    Mirrors the torch path of transformers' `WhisperFeatureExtractor`: waveforms are zero padded or truncated to 30 s,
+    and the log-mel spectrogram is clipped to 8 below its maximum and rescaled. The window and the mel filterbank are
+    built once. Frames past the end of the longest waveform only see padding, so their spectrum is known to be zero
+    and the STFT is computed on the speech part only.
+    """
+
+    def __init__(self, feature_extractor, device):
+        self.device = device
+        self.n_fft = feature_extractor.n_fft
+        self.hop_length = feature_extractor.hop_length
+        self.n_samples = feature_extractor.n_samples
+        self.nb_max_frames = feature_extractor.nb_max_frames
+        self.window = torch.hann_window(self.n_fft, device=device)
+        # (n_mels, n_freqs)
+        self.mel_filters = torch.from_numpy(feature_extractor.mel_filters).to(
+            device, torch.float32
+        ).T
+
+    @torch.no_grad()
+    def __call__(self, waveforms):
+        """
+        Returns the float32 input features, of shape (batch, n_mels, 3000), of a list of 16kHz mono waveforms.
+        """
+        lengths = [min(len(waveform), self.n_samples) for waveform in waveforms]
+        # samples needed for the frames that overlap speech, rounded up to whole hops. The reflection padding the STFT
+        # applies past this length only mirrors zeros, like the padding to 30 s does.
+        nb_samples = min(
+            self.n_samples,
+            -(-(max(lengths) + self.n_fft) // self.hop_length) * self.hop_length,
+        )
+        batch = torch.zeros((len(waveforms), nb_samples), device=self.device)
+        for i, (waveform, length) in enumerate(zip(waveforms, lengths)):
+            batch[i, :length] = torch.as_tensor(
+                waveform[:length], dtype=torch.float32
+            ).to(self.device, non_blocking=True)
+
+        stft = torch.stft(
+            batch,
+            self.n_fft,
+            self.hop_length,
+            window=self.window,
+            return_complex=True,
+        )
+        # the STFT of 30 s has one frame more than Whisper expects
+        magnitudes = stft[..., : self.nb_max_frames].abs() ** 2
+
+        mel_spec = torch.zeros(
+            (len(waveforms), self.mel_filters.shape[0], self.nb_max_frames),
+            device=self.device,
+        )
+        mel_spec[..., : magnitudes.shape[-1]] = self.mel_filters @ magnitudes
+
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        max_val = log_spec.amax(dim=(1, 2), keepdim=True)
+        log_spec = torch.maximum(log_spec, max_val - 8.0)
+        return (log_spec + 4.0) / 4.0
@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """
+    Synthesized audio of the sentences a TTS handler speaks, to answer frequent sentences without running the model.
+
+    Entries are int16 PCM at the output sample rate, keyed by the normalized text, the voice and the sample rate. The
+    least recently used entries are evicted once the in-memory tier exceeds `max_memory_mb`. With `cache_dir`, entries
+    are also written there as raw PCM files, which are memory-mapped on lookup and outlive the process.
+    Sentences of more than `max_words` words are not cached.
+    """
+
+    def __init__(self, max_memory_mb=64, cache_dir=None, max_words=16):
+        self.max_nbytes = int(max_memory_mb * 2**20)
+        self.nbytes = 0
+        self.cache_dir = cache_dir
+        self.max_words = max_words
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text, voice, sample_rate):
+        """
+        Returns the cache key of `text` spoken with `voice` at `sample_rate`, or None if `text` is not cacheable.
+        """
+        words = text.split()
+        if not words or len(words) > self.max_words:
+            return None
+        normalized = " ".join(words).casefold()
+        return hashlib.sha1(f"{voice}\n{sample_rate}\n{normalized}".encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def get(self, key):
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+        if audio is None and self.cache_dir is not None and os.path.exists(self.path(key)):
+            audio = np.memmap(self.path(key), dtype=np.int16, mode="r")
+            self.add(key, np.array(audio))
+
+        if audio is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.debug(
+                f"TTS audio cache hit, hit rate {self.hits / (self.hits + self.misses):.0%}"
+            )
+        return audio
+
+    def put(self, key, audio):
+        self.add(key, audio)
+        if self.cache_dir is not None:
+            # written under a temporary name so that readers never see a partial file
+            tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+            audio.astype(np.int16).tofile(tmp_path)
+            os.replace(tmp_path, self.path(key))
+
+    def add(self, key, audio):
+        if audio.nbytes > self.max_nbytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key).nbytes
+            self.entries[key] = audio
+            self.nbytes += audio.nbytes
+            while self.nbytes > self.max_nbytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
@@ -0,0 +1,121 @@
+import logging
+import threading
+from time import perf_counter, sleep
+
+import librosa
+import numpy as np
+
+from utils import split_blocks
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyMasker:
+    """
+    Plays a short prerendered clip, e.g. "Hmm." or a breath, while the pipeline computes a response that is slow to
+    come.
+
+    A turn starts when the VAD clears `should_listen` at the end of the user's speech. If the TTS has not started the
+    response `threshold_s` later, or right away if the average response latency of the previous turns is above
+    `threshold_s`, the blocks of one clip are put in `queue_out` at once. `response_started` takes the same lock, so
+    the response audio is queued after the clip and follows it without a gap.
+    """
+
+    def __init__(
+        self,
+        should_listen,
+        queue_out,
+        clips,
+        sampling_rate,
+        output_sample_rate,
+        threshold_s=0.8,
+        blocksize=512,
+        poll_interval_s=0.01,
+    ):
+        self.should_listen = should_listen
+        self.queue_out = queue_out
+        self.clips = clips
+        self.sampling_rate = sampling_rate
+        self.output_sample_rate = output_sample_rate
+        self.threshold_s = threshold_s
+        self.blocksize = blocksize
+        self.poll_interval_s = poll_interval_s
+        # int16 clips at the output sample rates they were needed at
+        self.resampled_clips = {}
+        self.next_clip = 0
+        self.predicted_latency = None
+
+        self.lock = threading.Lock()
+        self.turn_start = None
+        self.responded = False
+        self.played = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def clip(self):
+        output_rate = self.output_sample_rate.get()
+        if output_rate not in self.resampled_clips:
+            self.resampled_clips[output_rate] = [
+                (
+                    librosa.resample(clip, orig_sr=self.sampling_rate, target_sr=output_rate)
+                    * 32768
+                ).astype(np.int16)
+                for clip in self.clips
+            ]
+        clip = self.resampled_clips[output_rate][self.next_clip]
+        self.next_clip = (self.next_clip + 1) % len(self.clips)
+        return clip
+
+    def run(self):
+        was_listening = False
+        while not self.stopped:
+            sleep(self.poll_interval_s)
+            if self.should_listen.is_set():
+                was_listening = True
+                with self.lock:
+                    self.turn_start = None
+                    self.responded = False
+                    self.played = False
+                continue
+
+            with self.lock:
+                # turns start when listening stops, not before the first client connects
+                if self.turn_start is None and was_listening:
+                    self.turn_start = perf_counter()
+                was_listening = False
+                if self.turn_start is None or self.responded or self.played:
+                    continue
+                delay = (
+                    0
+                    if self.predicted_latency is not None
+                    and self.predicted_latency > self.threshold_s
+                    else self.threshold_s
+                )
+                if perf_counter() - self.turn_start < delay:
+                    continue
+                logger.debug(
+                    f"No response after {perf_counter() - self.turn_start:.3f} s, playing a masking clip"
+                )
+                for block in split_blocks(self.clip(), self.blocksize):
+                    self.queue_out.put(block)
+                # one clip per turn
+                self.played = True
+
+    def response_started(self):
+        """
+        To be called by the TTS before it outputs the first audio of a sentence.
+        """
+        with self.lock:
+            if self.turn_start is not None and not self.responded:
+                latency = perf_counter() - self.turn_start
+                self.predicted_latency = (
+                    latency
+                    if self.predicted_latency is None
+                    else 0.7 * self.predicted_latency + 0.3 * latency
+                )
+            self.responded = True
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
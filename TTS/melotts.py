@@ -1,10 +1,14 @@
 from melo.api import TTS
 import logging
+from time import perf_counter
 from baseHandler import BaseHandler
 import librosa
 import numpy as np
 from rich.console import Console
 import torch
+from TTS.audio_cache import AudioCache
+from TTS.latency_masker import LatencyMasker
+from utils import OutputSampleRate, ReplyProgress, split_blocks
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -18,26 +22,73 @@ class MeloTTSHandler(BaseHandler):
     def setup(
         self,
         should_listen,
+        output_sample_rate=None,
+        reply_progress=None,
         device="mps",
         language="EN_NEWEST",
         speaker_to_id="EN-Newest",
         gen_kwargs={},  # Unused
         blocksize=512,
+        audio_cache_mb=0,
+        audio_cache_dir=None,
+        audio_cache_max_words=16,
+        masking_threshold_s=None,
+        masking_phrases="Hmm.|Let me see.|Okay.",
+        streaming=True,
     ):
         print(device)
         self.should_listen = should_listen
+        self.output_sample_rate = output_sample_rate or OutputSampleRate()
+        self.reply_progress = reply_progress or ReplyProgress()
         self.device = device
         self.model = TTS(language=language, device=device)
+        self.sampling_rate = self.model.hps.data.sampling_rate
         self.speaker_id = self.model.hps.data.spk2id[speaker_to_id]
         self.blocksize = blocksize
+        self.streaming = streaming
+        self.voice = f"{language}/{speaker_to_id}"
+        self.audio_cache = (
+            AudioCache(audio_cache_mb, audio_cache_dir, audio_cache_max_words)
+            if audio_cache_mb > 0
+            else None
+        )
         self.warmup()
 
+        self.latency_masker = None
+        if masking_threshold_s is not None:
+            clips = [
+                self.model.tts_to_file(phrase, self.speaker_id, quiet=True)
+                for phrase in masking_phrases.split("|")
+            ]
+            self.latency_masker = LatencyMasker(
+                should_listen,
+                self.queue_out,
+                clips,
+                self.sampling_rate,
+                self.output_sample_rate,
+                threshold_s=masking_threshold_s,
+                blocksize=blocksize,
+            )
+
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
         _ = self.model.tts_to_file("text", self.speaker_id, quiet=True)
 
     def process(self, llm_sentence):
         console.print(f"[green]ASSISTANT: {llm_sentence}")
+        output_rate = self.output_sample_rate.get()
+        cache_key = None
+        if self.audio_cache is not None:
+            cache_key = self.audio_cache.key(llm_sentence, self.voice, output_rate)
+            audio = self.audio_cache.get(cache_key) if cache_key else None
+            if audio is not None:
+                if self.latency_masker is not None:
+                    self.latency_masker.response_started()
+                yield from split_blocks(audio, self.blocksize)
+                self.should_listen.set()
+                self.reply_progress.chunk_spoken()
+                return
+
         if self.device == "mps":
             import time
 
@@ -48,16 +99,40 @@ class MeloTTSHandler(BaseHandler):
                 time.time() - start
             )  # Removing this line makes it fail more often. I'm looking into it.
 
-        audio_chunk = self.model.tts_to_file(llm_sentence, self.speaker_id, quiet=True)
-        if len(audio_chunk) == 0:
-            self.should_listen.set()
-            return
-        audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
-        audio_chunk = (audio_chunk * 32768).astype(np.int16)
-        for i in range(0, len(audio_chunk), self.blocksize):
-            yield np.pad(
-                audio_chunk[i : i + self.blocksize],
-                (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
+        if self.streaming:
+            # tts_to_file splits the text into pieces, synthesizes them in turn and joins them with short silences.
+            # Synthesizing the pieces one by one gives the same audio, as soon as each piece is ready.
+            pieces = self.model.split_sentences_into_pieces(
+                llm_sentence, self.model.language, quiet=True
             )
+        else:
+            pieces = [llm_sentence]
 
+        start = perf_counter()
+        audio_chunks = []
+        for piece in pieces:
+            audio_chunk = self.model.tts_to_file(piece, self.speaker_id, quiet=True)
+            if len(audio_chunk) == 0:
+                continue
+            if output_rate != self.sampling_rate:
+                audio_chunk = librosa.resample(
+                    audio_chunk, orig_sr=self.sampling_rate, target_sr=output_rate
+                )
+            audio_chunk = (audio_chunk * 32768).astype(np.int16)
+            if not audio_chunks:
+                logger.debug(
+                    f"First of {len(pieces)} pieces synthesized in {perf_counter() - start:.3f} s"
+                )
+                if self.latency_masker is not None:
+                    self.latency_masker.response_started()
+            audio_chunks.append(audio_chunk)
+            yield from split_blocks(audio_chunk, self.blocksize)
+
+        if cache_key and audio_chunks:
+            self.audio_cache.put(cache_key, np.concatenate(audio_chunks))
         self.should_listen.set()
+        self.reply_progress.chunk_spoken()
+
+    def cleanup(self):
+        if self.latency_masker is not None:
+            self.latency_masker.stop()
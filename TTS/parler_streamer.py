@@ -0,0 +1,51 @@
+import torch
+from parler_tts import ParlerTTSStreamer
+
+
+class AdaptiveParlerTTSStreamer(ParlerTTSStreamer):
+    """
+    `ParlerTTSStreamer` with growing chunks: the first chunk is decoded after `play_steps` generation steps, and each
+    following one is `growth` times longer than the previous one, up to `max_play_steps` steps.
+
+    A small first chunk keeps the time to first audio low, while longer chunks afterwards limit the number of codec
+    decodes, each of which decodes all the tokens generated so far. The stride between chunks is the one of the first,
+    smallest, chunk.
+    """
+
+    def __init__(
+        self,
+        model,
+        device=None,
+        play_steps=10,
+        growth=2.0,
+        max_play_steps=None,
+        stride=None,
+        timeout=None,
+    ):
+        super().__init__(
+            model, device=device, play_steps=play_steps, stride=stride, timeout=timeout
+        )
+        self.growth = growth
+        self.max_play_steps = max(max_play_steps or play_steps, play_steps)
+        self.next_chunk_end = play_steps
+
+    def put(self, value):
+        batch_size = value.shape[0] // self.decoder.num_codebooks
+        if batch_size > 1:
+            raise ValueError("ParlerTTSStreamer only supports batch size 1")
+
+        if self.token_cache is None:
+            self.token_cache = value
+        else:
+            self.token_cache = torch.concatenate(
+                [self.token_cache, value[:, None]], dim=-1
+            )
+
+        if self.token_cache.shape[-1] >= self.next_chunk_end:
+            audio_values = self.apply_delay_pattern_mask(self.token_cache)
+            self.on_finalized_audio(audio_values[self.to_yield : -self.stride])
+            self.to_yield = len(audio_values) - self.stride
+            self.play_steps = min(
+                int(self.play_steps * self.growth), self.max_play_steps
+            )
+            self.next_chunk_end += self.play_steps
@@ -0,0 +1,46 @@
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceCache:
+    """
+    Tokenized voice description of a Parler-TTS model, and the text encoder outputs computed for it.
+
+    `attach` wraps the forward of the text encoder: when it is called on the token ids tensor of the description, as
+    returned by `inputs`, the stored outputs are returned instead of running the encoder again. Only the first
+    generation runs the encoder on the description. The tensor is matched by identity, which costs no copy of the ids
+    to the host.
+    """
+
+    def __init__(self, tokenizer, description, device):
+        tokenized = tokenizer(description, return_tensors="pt")
+        self.input_ids = tokenized.input_ids.to(device)
+        self.attention_mask = tokenized.attention_mask.to(device)
+        self.encoder_outputs = None
+
+    def inputs(self):
+        """
+        Returns the token ids and attention mask of the description, on the device.
+        """
+        return self.input_ids, self.attention_mask
+
+    def attach(self, text_encoder):
+        forward = text_encoder.forward
+
+        # keeps the signature of the encoder, which generate inspects to select the arguments it passes
+        @functools.wraps(forward)
+        def cached_forward(input_ids=None, *args, **kwargs):
+            cached = input_ids is not None and input_ids is self.input_ids
+            if cached and self.encoder_outputs is not None:
+                # generate replaces fields of the outputs it receives, hand out a copy
+                return type(self.encoder_outputs)(**self.encoder_outputs)
+
+            outputs = forward(input_ids, *args, **kwargs)
+            if cached:
+                self.encoder_outputs = type(outputs)(**outputs)
+                logger.debug("Cached the text encoder outputs of the voice description")
+            return outputs
+
+        text_encoder.forward = cached_forward
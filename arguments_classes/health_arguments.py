@@ -0,0 +1,24 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class HealthArguments:
+    health_port: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "If specified, the port of the HTTP health endpoints: /live, /ready and /status. Default is None (no endpoints)."
+        },
+    )
+    health_host: str = field(
+        default="0.0.0.0",
+        metadata={
+            "help": "The host IP address the health endpoints are served on. Default is '0.0.0.0'."
+        },
+    )
+    health_max_backlog: int = field(
+        default=8,
+        metadata={
+            "help": "Number of items waiting in a pipeline queue above which /ready reports the server as saturated. Default is 8."
+        },
+    )
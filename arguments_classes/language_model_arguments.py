@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
@@ -16,9 +17,17 @@ class LanguageModelHandlerArguments:
         },
     )
     lm_torch_dtype: str = field(
-        default="float16",
+        default="auto",
         metadata={
-            "help": "The PyTorch data type for the model and input tensors. One of `float32` (full-precision), `float16` or `bfloat16` (both half-precision)."
+            "help": "The PyTorch data type for the model and input tensors. One of `float32` (full-precision), `float16` or `bfloat16` (both half-precision), "
+            "or `auto` for float32 on CPU and float16 otherwise. Default is `auto`."
+        },
+    )
+    lm_quantization: str = field(
+        default=None,
+        metadata={
+            "help": "Set to 'int8' to apply dynamic int8 quantization to the linear layers of the model. Only supported on CPU, where "
+            "the model is then loaded in float32. Default is None (no quantization)."
         },
     )
     user_role: str = field(
@@ -63,3 +72,95 @@ class LanguageModelHandlerArguments:
             "help": "Number of interactions assitant-user to keep for the chat. None for no limitations."
         },
     )
+    lm_chat_max_tokens: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Maximum number of tokens of the chat messages kept as context. The oldest interactions are dropped once it is "
+            "exceeded, bounding the prompt length of every turn. Default is None, only the number of interactions (chat_size) is limited."
+        },
+    )
+    lm_chunking_policy: str = field(
+        default="sentence",
+        metadata={
+            "help": "How generated text is split before being sent to the TTS. 'sentence' sends every sentence as soon as it is complete. "
+            "'adaptive' cuts the first chunk early at a clause or word-count boundary to reduce time to first audio, then groups "
+            "sentences into growing chunks. Default is 'sentence'."
+        },
+    )
+    lm_first_chunk_min_words: int = field(
+        default=4,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, minimum number of words before the first chunk can be cut at a clause boundary. Default is 4."
+        },
+    )
+    lm_first_chunk_max_words: int = field(
+        default=12,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, number of words after which the first chunk is cut at the next word boundary. Default is 12."
+        },
+    )
+    lm_chunk_growth_factor: float = field(
+        default=2.0,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, factor by which the target size of each following chunk grows. Default is 2.0."
+        },
+    )
+    lm_max_chunk_words: int = field(
+        default=48,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, maximum target size of a chunk in words. Default is 48."
+        },
+    )
+    lm_reuse_kv_cache: bool = field(
+        default=True,
+        metadata={
+            "help": "Whether to keep the KV cache of the previous turn and only prefill the tokens added to the conversation. Default is True."
+        },
+    )
+    lm_prefix_cache_mb: float = field(
+        default=256,
+        metadata={
+            "help": "Memory budget in MB for the KV states of prompt prefixes common to every conversation, such as the system prompt, computed at startup. "
+            "With --lm_reuse_kv_cache, this only saves the prefill of the first turn, later turns reuse the cache of the previous one. "
+            "Set to 0 to disable the prefix cache. Default is 256."
+        },
+    )
+    lm_compact_history: bool = field(
+        default=False,
+        metadata={
+            "help": "Whether to summarize the interactions dropped from the chat into a short memory, while waiting for the user to speak. "
+            "Keeps context in long conversations at a near constant prompt length. Default is False."
+        },
+    )
+    lm_compaction_max_new_tokens: int = field(
+        default=96,
+        metadata={
+            "help": "Maximum number of tokens of the summary produced by history compaction. Default is 96."
+        },
+    )
+    lm_assistant_model_name: str = field(
+        default=None,
+        metadata={
+            "help": "A smaller model sharing the tokenizer of the language model, used as draft model for speculative decoding. "
+            "Acceptance rates are logged for each reply. Default is None (no speculative decoding)."
+        },
+    )
+    lm_num_assistant_tokens: int = field(
+        default=5,
+        metadata={
+            "help": "Number of tokens the draft model proposes before the language model verifies them. Default is 5."
+        },
+    )
+    lm_compile_mode: str = field(
+        default=None,
+        metadata={
+            "help": "Compile mode for torch compile. Either 'default', 'reduce-overhead' and 'max-autotune'. Uses a static KV cache, "
+            "and is not compatible with KV cache reuse, prefix caching and speculative decoding. Default is None (no compilation)"
+        },
+    )
+    lm_max_prompt_pad_length: int = field(
+        default=11,
+        metadata={
+            "help": "When using compilation, the prompt has to be padded to closest power of 2. This parameters sets the maximun power of 2 possible."
+        },
+    )
@@ -21,3 +21,42 @@ class MeloTTSHandlerArguments:
             "help": "Mapping of speaker names to speaker IDs. Default is ['EN-Newest']."
         },
     )
+    melo_streaming: bool = field(
+        default=True,
+        metadata={
+            "help": "Synthesize and send the pieces MeloTTS splits sentences into one by one, instead of the whole sentence at once. Default is True."
+        },
+    )
+    melo_audio_cache_mb: float = field(
+        default=0,
+        metadata={
+            "help": "Memory budget, in MB, of the cache of synthesized sentences, which answers repeated sentences without running the model. "
+            "Default is 0, which disables the cache."
+        },
+    )
+    melo_audio_cache_dir: str = field(
+        default=None,
+        metadata={
+            "help": "Directory where cached sentences are also stored as PCM files, memory-mapped on lookup and kept across restarts. "
+            "Default is None (memory only)."
+        },
+    )
+    melo_audio_cache_max_words: int = field(
+        default=16,
+        metadata={
+            "help": "Sentences with more words than this are not cached. Default is 16."
+        },
+    )
+    melo_masking_threshold_s: float = field(
+        default=None,
+        metadata={
+            "help": "If set, a short prerendered clip is played when the response has not started this many seconds after the end of the user's "
+            "speech, or right away when recent responses took longer than that. Default is None, which disables it."
+        },
+    )
+    melo_masking_phrases: str = field(
+        default="Hmm.|Let me see.|Okay.",
+        metadata={
+            "help": "'|' separated phrases rendered with the TTS voice at startup and played in turn to mask response latency. Default is 'Hmm.|Let me see.|Okay.'."
+        },
+    )
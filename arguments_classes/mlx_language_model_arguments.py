@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
@@ -63,3 +64,42 @@ class MLXLanguageModelHandlerArguments:
             "help": "Number of interactions assitant-user to keep for the chat. None for no limitations."
         },
     )
+    mlx_lm_chat_max_tokens: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Maximum number of tokens of the chat messages kept as context. The oldest interactions are dropped once it is "
+            "exceeded, bounding the prompt length of every turn. Default is None, only the number of interactions (chat_size) is limited."
+        },
+    )
+    mlx_lm_chunking_policy: str = field(
+        default="sentence",
+        metadata={
+            "help": "How generated text is split before being sent to the TTS. 'sentence' sends every sentence as soon as it is complete. "
+            "'adaptive' cuts the first chunk early at a clause or word-count boundary to reduce time to first audio, then groups "
+            "sentences into growing chunks. Default is 'sentence'."
+        },
+    )
+    mlx_lm_first_chunk_min_words: int = field(
+        default=4,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, minimum number of words before the first chunk can be cut at a clause boundary. Default is 4."
+        },
+    )
+    mlx_lm_first_chunk_max_words: int = field(
+        default=12,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, number of words after which the first chunk is cut at the next word boundary. Default is 12."
+        },
+    )
+    mlx_lm_chunk_growth_factor: float = field(
+        default=2.0,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, factor by which the target size of each following chunk grows. Default is 2.0."
+        },
+    )
+    mlx_lm_max_chunk_words: int = field(
+        default=48,
+        metadata={
+            "help": "With the 'adaptive' chunking policy, maximum target size of a chunk in words. Default is 48."
+        },
+    )
@@ -38,6 +38,27 @@ class ModuleArguments:
             "help": "The TTS to use. Either 'parler' or 'melo'. Default is 'parler'"
         },
     )
+    stage_isolation: str = field(
+        default="thread",
+        metadata={
+            "help": "How to run the VAD, STT, LLM and TTS stages. Either 'thread', all stages in one process, or "
+            "'process', each stage, or group of stages (see stage_groups), in its own process with its own thread pools. Default is 'thread'."
+        },
+    )
+    stage_groups: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "With process isolation, the stages that share a process, e.g. 'vad+stt,lm,tts' runs the VAD and the STT in one process and "
+            "the LLM and the TTS in one process each. Default is None, each stage in its own process."
+        },
+    )
+    audio_buffer_mb: float = field(
+        default=8,
+        metadata={
+            "help": "With process isolation, size in MB of the shared memory ring buffer through which each audio queue between processes "
+            "passes its audio. Default is 8."
+        },
+    )
     log_level: str = field(
         default="info",
         metadata={
@@ -49,9 +49,22 @@ class ParlerTTSHandlerArguments:
         },
     )
     play_steps_s: float = field(
-        default=1.0,
+        default=0.5,
+        metadata={
+            "help": "Duration in seconds of the first chunk of generated speech sent while streaming. Default is 0.5 seconds."
+        },
+    )
+    tts_play_steps_growth: float = field(
+        default=2.0,
         metadata={
-            "help": "The time interval in seconds for playing back the generated speech in steps. Default is 0.5 seconds."
+            "help": "Factor by which each streamed chunk is longer than the previous one. Longer chunks need fewer audio codec decodes. "
+            "Set to 1.0 for fixed size chunks. Default is 2.0."
+        },
+    )
+    tts_max_play_steps_s: float = field(
+        default=2.0,
+        metadata={
+            "help": "Maximum duration in seconds of a streamed chunk. Default is 2.0 seconds."
         },
     )
     max_prompt_pad_length: int = field(
@@ -60,3 +73,50 @@ class ParlerTTSHandlerArguments:
             "help": "When using compilation, the prompt as to be padded to closest power of 2. This parameters sets the maximun power of 2 possible."
         },
     )
+    tts_audio_cache_mb: float = field(
+        default=0,
+        metadata={
+            "help": "Memory budget, in MB, of the cache of synthesized sentences, which answers repeated sentences without running the model. "
+            "Default is 0, which disables the cache."
+        },
+    )
+    tts_audio_cache_dir: str = field(
+        default=None,
+        metadata={
+            "help": "Directory where cached sentences are also stored as PCM files, memory-mapped on lookup and kept across restarts. "
+            "Default is None (memory only)."
+        },
+    )
+    tts_audio_cache_max_words: int = field(
+        default=16,
+        metadata={
+            "help": "Sentences with more words than this are not cached. Default is 16."
+        },
+    )
+    tts_masking_threshold_s: float = field(
+        default=None,
+        metadata={
+            "help": "If set, a short prerendered clip is played when the response has not started this many seconds after the end of the user's "
+            "speech, or right away when recent responses took longer than that. Default is None, which disables it."
+        },
+    )
+    tts_masking_phrases: str = field(
+        default="Hmm.|Let me see.|Okay.",
+        metadata={
+            "help": "'|' separated phrases rendered with the TTS voice at startup and played in turn to mask response latency. Default is 'Hmm.|Let me see.|Okay.'."
+        },
+    )
+    tts_budget_s_per_char: float = field(
+        default=0.1,
+        metadata={
+            "help": "Each sentence generates at most tts_budget_base_s + tts_budget_s_per_char * (number of characters) seconds of audio, "
+            "within tts_gen_min_new_tokens and tts_gen_max_new_tokens. How often this budget stops generation is logged. "
+            "Set to 0 to always use tts_gen_max_new_tokens. Default is 0.1, a speaking rate of at least 10 characters per second."
+        },
+    )
+    tts_budget_base_s: float = field(
+        default=1.0,
+        metadata={
+            "help": "Seconds of audio every sentence budget starts with, see tts_budget_s_per_char. Default is 1.0."
+        },
+    )
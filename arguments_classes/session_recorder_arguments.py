@@ -0,0 +1,19 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class SessionRecorderArguments:
+    record_dir: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "If specified, each run records inbound audio, VAD segments, transcripts, LM sentences and outbound audio, with timestamps, "
+            "into a new file of this directory. Recordings can be replayed with replay_session.py. Default is None (no recording)."
+        },
+    )
+    record_buffer_size: int = field(
+        default=1024,
+        metadata={
+            "help": "Number of items waiting to be written above which the recorder drops items rather than slowing down the pipeline. Default is 1024."
+        },
+    )
@@ -16,3 +16,10 @@ class SocketSenderArguments:
             "help": "The port number on which the socket server listens. Default is 12346."
         },
     )
+    rate_handshake_timeout_s: float = field(
+        default=1.0,
+        metadata={
+            "help": "How long to wait, in seconds, for the client to announce its playback sample rate after connecting. "
+            "Clients that do not announce a rate receive 16kHz audio. Default is 1.0 second."
+        },
+    )
@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class StageResourcesArguments:
+    vad_num_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch intra-op threads of the VAD stage. Default is None, which keeps the torch default."
+        },
+    )
+    vad_num_interop_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch inter-op threads of the VAD stage. Default is None, which keeps the torch default."
+        },
+    )
+    vad_cpu_affinity: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "CPUs the VAD stage is pinned to, as a list such as '0-3,8'. Linux only. Default is None, no pinning."
+        },
+    )
+    stt_num_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch intra-op threads of the STT stage. Default is None, which keeps the torch default."
+        },
+    )
+    stt_num_interop_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch inter-op threads of the STT stage. Default is None, which keeps the torch default."
+        },
+    )
+    stt_cpu_affinity: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "CPUs the STT stage is pinned to, as a list such as '0-3,8'. Linux only. Default is None, no pinning."
+        },
+    )
+    lm_num_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch intra-op threads of the language model stage. Default is None, which keeps the torch default."
+        },
+    )
+    lm_num_interop_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch inter-op threads of the language model stage. Default is None, which keeps the torch default."
+        },
+    )
+    lm_cpu_affinity: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "CPUs the language model stage is pinned to, as a list such as '0-3,8'. Linux only. Default is None, no pinning."
+        },
+    )
+    tts_num_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch intra-op threads of the TTS stage. Default is None, which keeps the torch default."
+        },
+    )
+    tts_num_interop_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Number of torch inter-op threads of the TTS stage. Default is None, which keeps the torch default."
+        },
+    )
+    tts_cpu_affinity: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "CPUs the TTS stage is pinned to, as a list such as '0-3,8'. Linux only. Default is None, no pinning."
+        },
+    )
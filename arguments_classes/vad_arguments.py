@@ -39,3 +39,46 @@ class VADHandlerArguments:
             "help": "Amount of padding added to the beginning and end of detected speech segments. Measured in milliseconds. Default is 250 ms."
         },
     )
+    partial_interval_ms: int = field(
+        default=0,
+        metadata={
+            "help": "Interval, in milliseconds of speech, at which the speech buffered so far is sent to the STT for partial transcription while the user is "
+            "still speaking. Words on which two partial transcriptions agree are not decoded again at the end of speech. Default is 0, which disables it."
+        },
+    )
+    endpointing: str = field(
+        default="fixed",
+        metadata={
+            "help": "How the end of a turn is detected. 'fixed' waits for min_silence_ms of silence. 'adaptive' waits for endpoint_min_silence_ms when "
+            "the transcription of the speech so far and its pitch (see endpoint_prosody) both look like the end of a sentence, endpoint_max_silence_ms "
+            "when the transcription stops mid-sentence, and min_silence_ms otherwise. Needs tentative transcriptions (see tentative_silence_ms) "
+            "and the 'whisper' STT. Default is 'fixed'."
+        },
+    )
+    endpoint_min_silence_ms: int = field(
+        default=200,
+        metadata={
+            "help": "With adaptive endpointing, silence after which a turn that looks complete ends. Measured in milliseconds. Default is 200 ms."
+        },
+    )
+    endpoint_max_silence_ms: int = field(
+        default=2000,
+        metadata={
+            "help": "With adaptive endpointing, silence after which a turn that stops mid-sentence ends. Measured in milliseconds. Default is 2000 ms."
+        },
+    )
+    endpoint_prosody: bool = field(
+        default=True,
+        metadata={
+            "help": "With adaptive endpointing, whether a falling pitch at the end of the speech is also required to end a complete looking turn "
+            "after endpoint_min_silence_ms. Default is True."
+        },
+    )
+    tentative_silence_ms: int = field(
+        default=0,
+        metadata={
+            "help": "Silence, in milliseconds, after which the utterance is sent to the STT for a tentative transcription. It becomes the final one if "
+            "the user does not speak again before the end of the turn, and tells adaptive endpointing whether the turn looks complete. Default is 0, "
+            "which disables it."
+        },
+    )
@@ -16,9 +16,17 @@ class WhisperSTTHandlerArguments:
         },
     )
     stt_torch_dtype: str = field(
-        default="float16",
+        default="auto",
         metadata={
-            "help": "The PyTorch data type for the model and input tensors. One of `float32` (full-precision), `float16` or `bfloat16` (both half-precision)."
+            "help": "The PyTorch data type for the model and input tensors. One of `float32` (full-precision), `float16` or `bfloat16` (both half-precision), "
+            "or `auto` for float32 on CPU and float16 otherwise. Default is `auto`."
+        },
+    )
+    stt_quantization: str = field(
+        default=None,
+        metadata={
+            "help": "Set to 'int8' to apply dynamic int8 quantization to the linear layers of the model. Only supported on CPU, where "
+            "the model is then loaded in float32. Default is None (no quantization)."
         },
     )
     stt_compile_mode: str = field(
@@ -27,6 +35,32 @@ class WhisperSTTHandlerArguments:
             "help": "Compile mode for torch compile. Either 'default', 'reduce-overhead' and 'max-autotune'. Default is None (no compilation)"
         },
     )
+    stt_window_overlap_s: float = field(
+        default=5.0,
+        metadata={
+            "help": "Utterances longer than the 30 s input of Whisper are transcribed in 30 s windows overlapping by this many seconds, "
+            "and the transcriptions are merged at the overlaps. Should be at least 0 and less than 30. Default is 5.0 seconds."
+        },
+    )
+    stt_max_batch_size: int = field(
+        default=8,
+        metadata={
+            "help": "Maximum number of windows of a long utterance transcribed in one batch. Default is 8."
+        },
+    )
+    stt_budget_tokens_per_s: float = field(
+        default=8.0,
+        metadata={
+            "help": "Each transcription generates at most stt_budget_base_tokens + stt_budget_tokens_per_s * (seconds of audio) tokens, "
+            "bounded by stt_gen_max_new_tokens. How often this budget stops generation is logged. Set to 0 to always use stt_gen_max_new_tokens. Default is 8.0."
+        },
+    )
+    stt_budget_base_tokens: int = field(
+        default=16,
+        metadata={
+            "help": "Number of tokens every transcription budget starts with, see stt_budget_tokens_per_s. Default is 16."
+        },
+    )
     stt_gen_max_new_tokens: int = field(
         default=128,
         metadata={
@@ -1,6 +1,8 @@
 from time import perf_counter
 import logging
 
+from utils import StageStatus
+
 logger = logging.getLogger(__name__)
 
 
@@ -11,13 +13,37 @@ class BaseHandler:
     To stop a handler properly, set the stop_event and, to avoid queue deadlocks, place b"END" in the input queue.
     Objects placed in the input queue will be processed by the `process` method, and the yielded results will be placed in the output queue.
     The cleanup method handles stopping the handler, and b"END" is placed in the output queue.
+    An optional `cpu_resources` (see `utils.CPUResources`) sets the thread budget and CPU affinity of the handler when it starts running.
+    An optional `stage_status` (see `utils.StageStatus`) is updated as the handler loads its models, warms them up and is ready.
     """
 
-    def __init__(self, stop_event, queue_in, queue_out, setup_args=(), setup_kwargs={}):
+    def __init__(
+        self,
+        stop_event,
+        queue_in,
+        queue_out,
+        setup_args=(),
+        setup_kwargs={},
+        cpu_resources=None,
+        stage_status=None,
+    ):
         self.stop_event = stop_event
         self.queue_in = queue_in
         self.queue_out = queue_out
+        self.cpu_resources = cpu_resources
+        self.stage_status = stage_status
+        if stage_status is not None and hasattr(self, "warmup"):
+            # handlers warm up at the end of their setup, once their models are loaded
+            warmup = self.warmup
+
+            def reporting_warmup(*args, **kwargs):
+                stage_status.set(StageStatus.WARMING)
+                return warmup(*args, **kwargs)
+
+            self.warmup = reporting_warmup
         self.setup(*setup_args, **setup_kwargs)
+        if stage_status is not None:
+            stage_status.set(StageStatus.READY)
         self._times = []
 
     def setup(self):
@@ -27,6 +53,8 @@ class BaseHandler:
         raise NotImplementedError
 
     def run(self):
+        if self.cpu_resources is not None:
+            self.cpu_resources.apply()
         while not self.stop_event.is_set():
             input = self.queue_in.get()
             if isinstance(input, bytes) and input == b"END":
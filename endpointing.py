@@ -0,0 +1,136 @@
+import multiprocessing
+
+import librosa
+import numpy as np
+
+# last words after which a sentence is very unlikely to be over
+INCOMPLETE_ENDINGS = set(
+    "a an and are as at because but by for from if in is like my of on or so than that the then to uh um was were "
+    "with your".split()
+)
+
+
+def transcript_completeness(text):
+    """
+    Returns 1 if a transcript looks like a complete turn, -1 if it stops mid-sentence and 0 if it is unclear.
+    """
+    text = text.strip()
+    if not text:
+        return 0
+    if text.endswith((",", "-", "...", "…")):
+        return -1
+    if text.split()[-1].strip(".,?!").casefold() in INCOMPLETE_ENDINGS:
+        return -1
+    if text.endswith((".", "?", "!")):
+        return 1
+    return 0
+
+
+def pitch_falling(audio, sample_rate, tail_s=0.25, context_s=1.5, min_fall=0.1):
+    """
+    Returns whether the pitch of the last `tail_s` seconds of speech of `audio` is at least `min_fall` below the pitch
+    of the speech before it, within the last `context_s` seconds. A falling pitch usually ends a declarative sentence.
+    """
+    audio = audio[-int(context_s * sample_rate) :]
+    frame_length, hop_length = 1024, 256
+    if len(audio) < 2 * frame_length:
+        return False
+    f0 = librosa.yin(
+        audio,
+        fmin=60,
+        fmax=400,
+        sr=sample_rate,
+        frame_length=frame_length,
+        hop_length=hop_length,
+    )
+    rms = librosa.feature.rms(y=audio, frame_length=frame_length, hop_length=hop_length)[0]
+    # yin has no voicing decision, quiet frames are silence or unvoiced consonants
+    voiced = f0[: len(rms)][rms[: len(f0)] > 0.3 * rms.max()]
+    nb_tail = max(1, int(tail_s * sample_rate / hop_length))
+    if len(voiced) < 2 * nb_tail:
+        return False
+    return np.median(voiced[-nb_tail:]) < (1 - min_fall) * np.median(voiced[:-nb_tail])
+
+
+class TurnHint:
+    """
+    Completeness of the latest transcription of the ongoing utterance, written by the STT and read by the VAD to
+    adapt its end of turn silence. `nb_samples` is the length of the transcribed audio, which tells the VAD whether
+    the transcription covers the current pause. Lives in shared memory, like `utils.OutputSampleRate`, so that it is
+    also seen by stages running in their own process.
+    """
+
+    def __init__(self):
+        self.utterance_id = multiprocessing.Value("i", -1, lock=False)
+        self.nb_samples = multiprocessing.Value("i", 0, lock=False)
+        self.completeness = multiprocessing.Value("i", 0, lock=False)
+
+    def set(self, utterance_id, nb_samples, completeness):
+        # the id is written last, readers never match an id with the values of the previous utterance
+        self.utterance_id.value = -1
+        self.nb_samples.value = nb_samples
+        self.completeness.value = completeness
+        self.utterance_id.value = utterance_id
+
+    def get(self, utterance_id, min_samples):
+        """
+        Returns the completeness of the transcription of `utterance_id` if it covers at least `min_samples`, else 0.
+        """
+        completeness = self.completeness.value
+        if self.utterance_id.value == utterance_id and self.nb_samples.value >= min_samples:
+            return completeness
+        return 0
+
+
+class EndpointingPolicy:
+    """
+    Silence after which the VAD ends a turn. When the user pauses, the pitch of the end of the speech and the
+    completeness of a transcription covering the pause (see `TurnHint`) are the cues of the end of the turn. A
+    transcription stopping mid-sentence waits `max_silence_ms`. The turn ends after `min_silence_ms` only when every cue
+    in use agrees that it is complete, a falling pitch alone is too often followed by more words. `silence_ms` is
+    waited otherwise.
+    """
+
+    def __init__(
+        self,
+        silence_ms,
+        min_silence_ms,
+        max_silence_ms,
+        use_prosody=True,
+        sample_rate=16000,
+    ):
+        self.silence_ms = silence_ms
+        self.min_silence_ms = min_silence_ms
+        self.max_silence_ms = max_silence_ms
+        self.use_prosody = use_prosody
+        self.sample_rate = sample_rate
+        self.reset()
+
+    def reset(self):
+        self.prosody = 0
+        self.completeness = 0
+
+    def on_pause(self, audio):
+        """
+        To be called when the user pauses, with the speech of the utterance so far.
+        """
+        self.completeness = 0
+        if self.use_prosody:
+            self.prosody = int(pitch_falling(audio, self.sample_rate))
+
+    def threshold_ms(self, completeness=0):
+        """
+        Returns the silence to wait, given the completeness of the transcription covering the pause, see
+        `transcript_completeness`.
+        """
+        self.completeness = completeness
+        if self.completeness < 0:
+            return self.max_silence_ms
+        if self.completeness > 0 and (self.prosody > 0 or not self.use_prosody):
+            return self.min_silence_ms
+        return self.silence_ms
+
+    def describe(self):
+        transcript = {1: "complete", -1: "incomplete", 0: "unknown"}[self.completeness]
+        pitch = "falling" if self.prosody else "not falling" if self.use_prosody else "not used"
+        return f"transcript {transcript}, pitch {pitch}"
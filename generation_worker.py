@@ -0,0 +1,72 @@
+import logging
+import threading
+from concurrent.futures import Future
+from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+
+def close_streamer(streamer):
+    """
+    Puts the end of stream signal in the queue of a `TextIteratorStreamer` or `ParlerTTSStreamer`, so that a consumer
+    iterating over it stops.
+    """
+    for name in ("text_queue", "audio_queue"):
+        queue = getattr(streamer, name, None)
+        if queue is not None:
+            queue.put(streamer.stop_signal)
+            return
+
+
+class GenerationWorker:
+    """
+    Long-lived thread running the generation calls of one model, one at a time and in submission order.
+
+    Each request comes with its own streamer. If the generation fails, the streamer is closed so that the consumer
+    iterating over it is not left waiting, and the exception is re-raised by the `result` method of the future returned
+    by `submit`.
+
+    The thread applies `cpu_resources`, if given, before running any job, so that generation runs under the budget of
+    the handler that owns the worker.
+    """
+
+    def __init__(self, name, cpu_resources=None):
+        self.name = name
+        self.cpu_resources = cpu_resources
+        self.jobs = Queue()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, streamer=None, **kwargs):
+        """
+        Schedules `fn(**kwargs)`, passing `streamer` along if given, and returns a `concurrent.futures.Future`.
+        """
+        if streamer is not None:
+            kwargs["streamer"] = streamer
+        future = Future()
+        self.jobs.put((future, fn, streamer, kwargs))
+        return future
+
+    def run(self):
+        if self.cpu_resources is not None:
+            self.cpu_resources.apply()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, fn, streamer, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                if streamer is not None:
+                    close_streamer(streamer)
+                continue
+            try:
+                future.set_result(fn(**kwargs))
+            except BaseException as e:
+                logger.debug(f"{self.name}: generation failed with {e!r}")
+                if streamer is not None:
+                    close_streamer(streamer)
+                future.set_exception(e)
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
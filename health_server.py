@@ -0,0 +1,109 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class HealthRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        health = self.server.health
+        status = health.status()
+        if self.path == "/live":
+            code = 200 if status["live"] else 503
+        elif self.path == "/ready":
+            code = 200 if status["ready"] else 503
+        elif self.path == "/status":
+            code = 200
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(status).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # probes hit these endpoints every few seconds
+        logger.debug(format % args)
+
+
+class HealthServer:
+    """
+    HTTP endpoints for orchestrators, served by a daemon thread:
+    - `/live` answers 200 as long as no handler thread or stage process has died,
+    - `/ready` answers 200 once every stage has loaded and warmed up its models, while no queue holds more than
+      `max_backlog` items and no client is connected, since the socket handlers serve a single client,
+    - `/status` answers the full report as JSON: the state of each stage, the liveness of each handler, the backlog
+      of each queue and the number of active sessions.
+
+    `stage_statuses` maps stage names to `utils.StageStatus`, `queues` maps names to the pipeline queues. The pipeline
+    manager is given with `set_manager` once it is started, handlers are not reported before that.
+    """
+
+    def __init__(
+        self,
+        stage_statuses,
+        queues,
+        comms_handlers,
+        host="0.0.0.0",
+        port=8080,
+        max_backlog=8,
+    ):
+        self.stage_statuses = stage_statuses
+        self.queues = queues
+        self.comms_handlers = comms_handlers
+        self.host = host
+        self.port = port
+        self.max_backlog = max_backlog
+        self.manager = None
+
+    def set_manager(self, manager):
+        self.manager = manager
+
+    def status(self):
+        stages = {name: status.name() for name, status in self.stage_statuses.items()}
+        handlers = dict(self.manager.liveness()) if self.manager is not None else {}
+        queues = {}
+        for name, queue in self.queues.items():
+            try:
+                queues[name] = queue.qsize()
+            except NotImplementedError:
+                # multiprocessing queues do not implement qsize on macOS
+                queues[name] = None
+        active_sessions = sum(
+            getattr(handler, "connected", False) for handler in self.comms_handlers
+        )
+
+        live = all(handlers.values())
+        ready = (
+            live
+            and self.manager is not None
+            and all(state == "ready" for state in stages.values())
+            and all(size is None or size <= self.max_backlog for size in queues.values())
+            and active_sessions == 0
+        )
+        return {
+            "live": live,
+            "ready": ready,
+            "stages": stages,
+            "handlers": handlers,
+            "queues": queues,
+            "active_sessions": active_sessions,
+        }
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), HealthRequestHandler)
+        self.server.daemon_threads = True
+        self.server.health = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Health endpoints served on http://{self.host}:{self.port}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.thread.join()
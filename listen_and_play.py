@@ -1,4 +1,5 @@
 import socket
+import struct
 import threading
 from queue import Queue
 from dataclasses import dataclass, field
@@ -9,7 +10,12 @@ from transformers import HfArgumentParser
 @dataclass
 class ListenAndPlayArguments:
     send_rate: int = field(default=16000, metadata={"help": "In Hz. Default is 16000."})
-    recv_rate: int = field(default=44100, metadata={"help": "In Hz. Default is 44100."})
+    recv_rate: int = field(
+        default=44100,
+        metadata={
+            "help": "In Hz. Announced to the server, which then sends audio at this rate. Default is 44100."
+        },
+    )
     list_play_chunk_size: int = field(
         default=1024,
         metadata={"help": "The size of data chunks (in bytes). Default is 1024."},
@@ -43,6 +49,8 @@ def listen_and_play(
 
     recv_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     recv_socket.connect((host, recv_port))
+    # announce the playback rate so that the server sends audio we can play as is
+    recv_socket.sendall(struct.pack("<I", recv_rate))
 
     print("Recording and streaming...")
 
@@ -0,0 +1,269 @@
+import logging
+import socket
+import struct
+import threading
+from dataclasses import dataclass, field
+from queue import Empty, Queue
+from threading import Event
+from time import perf_counter, sleep
+from typing import Optional
+
+import numpy as np
+from transformers import HfArgumentParser
+
+import s2s_pipeline
+from arguments_classes.melo_tts_arguments import MeloTTSHandlerArguments
+from arguments_classes.parler_tts_arguments import ParlerTTSHandlerArguments
+from arguments_classes.language_model_arguments import LanguageModelHandlerArguments
+from arguments_classes.vad_arguments import VADHandlerArguments
+from arguments_classes.whisper_stt_arguments import WhisperSTTHandlerArguments
+from session_recorder import SessionRecorder, read_session
+from STT.streaming import PartialUtterance
+from utils import OutputSampleRate
+
+logger = logging.getLogger(__name__)
+
+# stream of the recording each stage takes its inputs from
+STAGE_INPUTS = {"vad": "input", "stt": "vad", "lm": "transcript", "tts": "llm"}
+# stream of the recording each stage produces
+STAGE_OUTPUTS = {"vad": "vad", "stt": "transcript", "lm": "llm", "tts": "output"}
+
+
+@dataclass
+class ReplayArguments:
+    recording: str = field(
+        metadata={"help": "Session recording written by s2s_pipeline.py with --record_dir."}
+    )
+    target: str = field(
+        default="pipeline",
+        metadata={
+            "help": "What to replay the recording against. 'pipeline' streams the recorded input audio to a running server, "
+            "'vad', 'stt', 'lm', 'tts' (Parler-TTS) or 'tts-melo' feed the recorded inputs of that stage to a handler built in this process, "
+            "configured with the same arguments as s2s_pipeline.py. Default is 'pipeline'."
+        },
+    )
+    realtime: bool = field(
+        default=True,
+        metadata={
+            "help": "Whether to keep the recorded timing between inputs. Otherwise inputs are sent as fast as possible. Default is True."
+        },
+    )
+    output: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "If specified, what the replayed pipeline or stage outputs is recorded to this file, to be compared with the original recording. Default is None."
+        },
+    )
+    host: str = field(
+        default="localhost",
+        metadata={"help": "Hostname of the server, with --target pipeline. Default is 'localhost'."},
+    )
+    send_port: int = field(
+        default=12345,
+        metadata={"help": "Port the server receives audio on. Default is 12345."},
+    )
+    recv_port: int = field(
+        default=12346,
+        metadata={"help": "Port the server sends audio from. Default is 12346."},
+    )
+    recv_rate: int = field(
+        default=16000,
+        metadata={"help": "In Hz. Announced to the server, which then sends audio at this rate. Default is 16000."},
+    )
+    tail_s: float = field(
+        default=5.0,
+        metadata={
+            "help": "Seconds to keep receiving audio after the last input has been sent, with --target pipeline. Default is 5.0."
+        },
+    )
+    log_level: str = field(
+        default="info",
+        metadata={"help": "Provide logging level. Example --log_level debug, default=info."},
+    )
+
+
+def wait_until(start, timestamp, realtime):
+    if realtime:
+        sleep(max(0.0, timestamp - (perf_counter() - start)))
+
+
+def replay_pipeline(records, args, recorder=None):
+    """
+    Streams the recorded input audio to a running pipeline, like listen_and_play.py would from a microphone.
+    """
+    send_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    send_socket.connect((args.host, args.send_port))
+    recv_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    recv_socket.connect((args.host, args.recv_port))
+    recv_socket.sendall(struct.pack("<I", args.recv_rate))
+
+    stop_event = Event()
+
+    def recv():
+        recv_socket.settimeout(0.1)
+        while not stop_event.is_set():
+            try:
+                data = recv_socket.recv(4096)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            if recorder is not None:
+                recorder.record("output", data[: len(data) // 2 * 2])
+
+    recv_thread = threading.Thread(target=recv)
+    recv_thread.start()
+
+    inputs = [(timestamp, payload) for timestamp, stream, payload in records if stream == "input"]
+    logger.info(f"Sending {len(inputs)} recorded audio chunks")
+    start = perf_counter()
+    try:
+        for timestamp, payload in inputs:
+            wait_until(start, timestamp, args.realtime)
+            send_socket.sendall(payload.tobytes())
+            if recorder is not None:
+                recorder.record("input", payload)
+        sleep(args.tail_s)
+    finally:
+        stop_event.set()
+        recv_thread.join()
+        send_socket.close()
+        recv_socket.close()
+
+
+def build_stage(target, remaining_args):
+    """
+    Builds the handler of a stage from the command line arguments of s2s_pipeline.py.
+    """
+    arguments_class = {
+        "vad": VADHandlerArguments,
+        "stt": WhisperSTTHandlerArguments,
+        "lm": LanguageModelHandlerArguments,
+        "tts": ParlerTTSHandlerArguments,
+        "tts-melo": MeloTTSHandlerArguments,
+    }[target]
+    (kwargs,) = HfArgumentParser((arguments_class,)).parse_args_into_dataclasses(
+        args=remaining_args
+    )
+    should_listen = Event()
+    should_listen.set()
+    # handlers run in this process and are fed directly. queue_in stays empty, which handlers check to skip outdated
+    # work, and queue_out only receives what handlers put there on their own, e.g. latency masking clips
+    handler_kwargs = dict(
+        stop_event=Event(),
+        queue_in=Queue(),
+        queue_out=Queue(),
+        setup_kwargs=vars(kwargs),
+    )
+    if target == "vad":
+        return s2s_pipeline.VADHandler(setup_args=(should_listen,), **handler_kwargs)
+    if target == "stt":
+        s2s_pipeline.prepare_args(kwargs, "stt")
+        return s2s_pipeline.WhisperSTTHandler(**handler_kwargs)
+    if target == "lm":
+        s2s_pipeline.prepare_args(kwargs, "lm")
+        return s2s_pipeline.LanguageModelHandler(
+            setup_args=(should_listen,), **handler_kwargs
+        )
+    if target == "tts":
+        s2s_pipeline.prepare_args(kwargs, "tts")
+        return s2s_pipeline.ParlerTTSHandler(
+            setup_args=(should_listen, OutputSampleRate(default=16000)),
+            **handler_kwargs,
+        )
+    from TTS.melotts import MeloTTSHandler
+
+    s2s_pipeline.prepare_args(kwargs, "melo")
+    return MeloTTSHandler(
+        setup_args=(should_listen, OutputSampleRate(default=16000)), **handler_kwargs
+    )
+
+
+def stage_input(target, payload):
+    if target == "vad":
+        return payload.tobytes()
+    if target == "stt" and isinstance(payload, PartialUtterance):
+        audio = np.array(payload.audio) if payload.audio is not None else None
+        return PartialUtterance(audio, payload.utterance_id, tentative=payload.tentative)
+    if target == "stt":
+        return np.array(payload)
+    return payload
+
+
+def replay_stage(records, args, remaining_args, recorder=None):
+    """
+    Feeds the recorded inputs of a stage to its handler and logs how long each of them took.
+    """
+    stage = args.target.split("-")[0]
+    handler = build_stage(args.target, remaining_args)
+    inputs = [
+        (timestamp, payload)
+        for timestamp, stream, payload in records
+        if stream == STAGE_INPUTS[stage]
+    ]
+    logger.info(f"Replaying {len(inputs)} recorded inputs through the {args.target} stage")
+    start = perf_counter()
+    try:
+        for timestamp, payload in inputs:
+            wait_until(start, timestamp, args.realtime)
+            input_start = perf_counter()
+            first_output = None
+            outputs = 0
+            for output in handler.process(stage_input(stage, payload)):
+                if first_output is None:
+                    first_output = perf_counter() - input_start
+                outputs += 1
+                if recorder is not None:
+                    recorder.record(STAGE_OUTPUTS[stage], output)
+            # e.g. latency masking clips, played before the response
+            while True:
+                try:
+                    output = handler.queue_out.get_nowait()
+                except Empty:
+                    break
+                if recorder is not None:
+                    recorder.record(STAGE_OUTPUTS[stage], output)
+            # the VAD is fed small chunks, most of which do not output anything
+            if outputs or stage != "vad":
+                logger.info(
+                    f"{outputs} outputs, first after {first_output or 0:.3f} s, done after {perf_counter() - input_start:.3f} s"
+                )
+    finally:
+        if hasattr(handler, "cleanup"):
+            handler.cleanup()
+
+
+def main():
+    parser = HfArgumentParser((ReplayArguments,))
+    # the remaining arguments configure the replayed stage, as for s2s_pipeline.py
+    replay_args, remaining_args = parser.parse_args_into_dataclasses(
+        return_remaining_strings=True
+    )
+    logging.basicConfig(
+        level=replay_args.log_level.upper(),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # the handlers log through the module logger of the pipeline
+    s2s_pipeline.logger = logging.getLogger("s2s_pipeline")
+
+    if replay_args.target not in ("pipeline", "vad", "stt", "lm", "tts", "tts-melo"):
+        raise ValueError(
+            "The target should be either pipeline, vad, stt, lm, tts or tts-melo"
+        )
+
+    _, records = read_session(replay_args.recording)
+    recorder = (
+        SessionRecorder(replay_args.output) if replay_args.output is not None else None
+    )
+    try:
+        if replay_args.target == "pipeline":
+            replay_pipeline(records, replay_args, recorder)
+        else:
+            replay_stage(records, replay_args, remaining_args, recorder)
+    finally:
+        if recorder is not None:
+            recorder.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,52 @@
+import atexit
 import logging
+import multiprocessing
 import os
 import socket
+import struct
 import sys
 import threading
 from copy import copy
+from functools import partial
 from pathlib import Path
 from queue import Queue
-from threading import Event, Thread
-from time import perf_counter
+from threading import Event
+from time import perf_counter, strftime
 from typing import Optional
 from sys import platform
+from arguments_classes.health_arguments import HealthArguments
 from arguments_classes.language_model_arguments import LanguageModelHandlerArguments
 from arguments_classes.mlx_language_model_arguments import MLXLanguageModelHandlerArguments
 from arguments_classes.module_arguments import ModuleArguments
 from arguments_classes.parler_tts_arguments import ParlerTTSHandlerArguments
 from arguments_classes.socket_receiver_arguments import SocketReceiverArguments
+from arguments_classes.session_recorder_arguments import SessionRecorderArguments
 from arguments_classes.socket_sender_arguments import SocketSenderArguments
+from arguments_classes.stage_resources_arguments import StageResourcesArguments
 from arguments_classes.vad_arguments import VADHandlerArguments
 from arguments_classes.whisper_stt_arguments import WhisperSTTHandlerArguments
 from baseHandler import BaseHandler
+from LLM.chat import Chat
+from LLM.compaction import PreemptionCriteria, memory_messages, summary_request
+from LLM.kv_cache import (
+    PrefixCache,
+    SessionKVCache,
+    common_prefix_length,
+    generate_with_cache,
+)
+from LLM.sentence_segmenter import build_text_chunker
+from LLM.speculative import AcceptanceTracker, check_assistant_tokenizer
+from STT.long_form import merge_transcripts, split_windows
+from STT.streaming import LocalAgreement, PartialUtterance
+from STT.whisper_features import WhisperLogMel
+from TTS.audio_cache import AudioCache
+from TTS.latency_masker import LatencyMasker
+from TTS.parler_streamer import AdaptiveParlerTTSStreamer
+from TTS.voice_cache import VoiceCache
 from arguments_classes.melo_tts_arguments import MeloTTSHandlerArguments
 import numpy as np
 import torch
 import nltk
-from nltk.tokenize import sent_tokenize
 from rich.console import Console
 from transformers import (
     AutoModelForCausalLM,
@@ -31,14 +54,32 @@ from transformers import (
     AutoProcessor,
     AutoTokenizer,
     HfArgumentParser,
-    pipeline,
+    StoppingCriteriaList,
     TextIteratorStreamer,
 )
-from parler_tts import ParlerTTSForConditionalGeneration, ParlerTTSStreamer
+from parler_tts import ParlerTTSForConditionalGeneration
 import librosa
 
+from generation_worker import GenerationWorker
+from health_server import HealthServer
+from endpointing import EndpointingPolicy, TurnHint, transcript_completeness
 from local_audio_streamer import LocalAudioStreamer
-from utils import VADIterator, int2float, next_power_of_2
+from session_recorder import RecordingQueue, RecordingSink, SessionRecorder
+from shared_audio_queue import GroupLocalQueue, SharedAudioQueue
+from utils import (
+    CPUResources,
+    GenerationBudget,
+    OutputSampleRate,
+    ReplyProgress,
+    StageStatus,
+    VADIterator,
+    int2float,
+    next_power_of_2,
+    prepare_quantization,
+    quantize_dynamic_int8,
+    resolve_torch_dtype,
+    split_blocks,
+)
 
 # Ensure that the necessary NLTK resources are available
 try:
@@ -80,6 +121,88 @@ class ThreadManager:
         for thread in self.threads:
             thread.join()
 
+    def liveness(self):
+        return [
+            (type(handler).__name__, thread.is_alive())
+            for handler, thread in zip(self.handlers, self.threads)
+        ]
+
+
+def run_stage_group(build_handlers, log_level):
+    """
+    Entry point of a stage process: sets up logging, then builds the handlers of its stages, each under its CPU budget,
+    and runs them as threads. Queues between the stages of the group are created as they are unpickled here (see
+    `GroupLocalQueue`).
+    """
+    global logger
+    logging.basicConfig(
+        level=log_level.upper(),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    if log_level == "debug":
+        torch._logging.set_logs(graph_breaks=True, recompiles=True, cudagraphs=True)
+
+    handlers = []
+    for build_handler in build_handlers:
+        cpu_resources = build_handler.keywords.get("cpu_resources")
+        if cpu_resources is not None:
+            # model loading and warmup happen in the handler constructor, under the same budget
+            cpu_resources.apply()
+        handlers.append(build_handler())
+    ThreadManager(handlers).start()
+
+
+class ProcessManager:
+    """
+    Runs groups of pipeline stages in their own process, and the communication handlers as threads of the main
+    process. Stages are given as `functools.partial` handler constructors and built in their process, so that models
+    are loaded where they run. The queues and events they share with other processes must come from the
+    multiprocessing context given here. A group process is sized with the thread pool environment of its first stage.
+    """
+
+    def __init__(self, stop_event, comms_handlers, stage_groups, log_level, context):
+        self.stop_event = stop_event
+        self.thread_manager = ThreadManager(comms_handlers)
+        self.stage_groups = stage_groups
+        self.log_level = log_level
+        self.context = context
+        self.processes = []
+
+    def start(self):
+        for build_handlers in self.stage_groups:
+            process = self.context.Process(
+                target=run_stage_group,
+                args=(build_handlers, self.log_level),
+                name="+".join(build_handler.func.__name__ for build_handler in build_handlers),
+            )
+            cpu_resources = build_handlers[0].keywords.get("cpu_resources")
+            environment = cpu_resources.environment() if cpu_resources else {}
+            # spawned processes read the environment when they start, this sizes their OpenMP and BLAS pools
+            previous = {name: os.environ.get(name) for name in environment}
+            os.environ.update(environment)
+            try:
+                process.start()
+            finally:
+                for name, value in previous.items():
+                    if value is None:
+                        os.environ.pop(name)
+                    else:
+                        os.environ[name] = value
+            self.processes.append(process)
+        self.thread_manager.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread_manager.stop()
+        for process in self.processes:
+            process.join()
+
+    def liveness(self):
+        return self.thread_manager.liveness() + [
+            (process.name, process.is_alive()) for process in self.processes
+        ]
+
 
 class SocketReceiver:
     """
@@ -101,6 +224,7 @@ class SocketReceiver:
         self.chunk_size = chunk_size
         self.host = host
         self.port = port
+        self.connected = False
 
     def receive_full_chunk(self, conn, chunk_size):
         data = b""
@@ -119,6 +243,7 @@ class SocketReceiver:
         self.socket.listen(1)
         logger.info("Receiver waiting to be connected...")
         self.conn, _ = self.socket.accept()
+        self.connected = True
         logger.info("receiver connected")
 
         self.should_listen.set()
@@ -131,6 +256,7 @@ class SocketReceiver:
             if self.should_listen.is_set():
                 self.queue_out.put(audio_chunk)
         self.conn.close()
+        self.connected = False
         logger.info("Receiver closed")
 
 
@@ -139,11 +265,48 @@ class SocketSender:
     Handles sending generated audio packets to the clients.
     """
 
-    def __init__(self, stop_event, queue_in, host="0.0.0.0", port=12346):
+    def __init__(
+        self,
+        stop_event,
+        queue_in,
+        output_sample_rate,
+        host="0.0.0.0",
+        port=12346,
+        rate_handshake_timeout_s=1.0,
+    ):
         self.stop_event = stop_event
         self.queue_in = queue_in
+        self.output_sample_rate = output_sample_rate
         self.host = host
         self.port = port
+        self.rate_handshake_timeout_s = rate_handshake_timeout_s
+
+    def negotiate_sample_rate(self):
+        """
+        Clients may announce their playback rate as a little-endian uint32 right after connecting.
+        Older clients send nothing, in which case the default output rate is kept.
+        """
+        self.output_sample_rate.reset()
+        header = b""
+        self.conn.settimeout(self.rate_handshake_timeout_s)
+        try:
+            while len(header) < 4:
+                packet = self.conn.recv(4 - len(header))
+                if not packet:
+                    break
+                header += packet
+        except socket.timeout:
+            pass
+        finally:
+            self.conn.settimeout(None)
+
+        if len(header) == 4:
+            rate = struct.unpack("<I", header)[0]
+            if 8000 <= rate <= 192000:
+                self.output_sample_rate.set(rate)
+            else:
+                logger.warning(f"Ignoring invalid playback rate announced by client: {rate}")
+        logger.info(f"Sending audio at {self.output_sample_rate.get()} Hz")
 
     def run(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -153,6 +316,7 @@ class SocketSender:
         logger.info("Sender waiting to be connected...")
         self.conn, _ = self.socket.accept()
         logger.info("sender connected")
+        self.negotiate_sample_rate()
 
         while not self.stop_event.is_set():
             audio_chunk = self.queue_in.get()
@@ -172,18 +336,59 @@ class VADHandler(BaseHandler):
     def setup(
         self,
         should_listen,
+        turn_hint=None,
         thresh=0.3,
         sample_rate=16000,
         min_silence_ms=1000,
         min_speech_ms=500,
         max_speech_ms=float("inf"),
         speech_pad_ms=30,
+        partial_interval_ms=0,
+        endpointing="fixed",
+        endpoint_min_silence_ms=200,
+        endpoint_max_silence_ms=2000,
+        endpoint_prosody=True,
+        tentative_silence_ms=0,
     ):
         self.should_listen = should_listen
+        self.turn_hint = turn_hint
         self.sample_rate = sample_rate
         self.min_silence_ms = min_silence_ms
         self.min_speech_ms = min_speech_ms
         self.max_speech_ms = max_speech_ms
+        self.partial_interval_samples = sample_rate * partial_interval_ms / 1000
+        self.tentative_silence_samples = sample_rate * tentative_silence_ms / 1000
+        self.utterance_id = 0
+        self.partial_samples = 0
+        self.tentative_sent = False
+        # speech samples of the utterance when the current pause started
+        self.pause_samples = 0
+        if endpointing == "adaptive" and turn_hint is None:
+            logger.warning(
+                "Adaptive endpointing needs an STT that reports the completeness of its transcriptions. Reverting to 'fixed'"
+            )
+            self.endpointing = None
+        elif endpointing == "adaptive" and not tentative_silence_ms:
+            # partial transcriptions rarely cover the pause, only tentative ones tell whether the turn looks complete
+            logger.warning(
+                "Adaptive endpointing needs tentative transcriptions, set tentative_silence_ms. Reverting to 'fixed'"
+            )
+            self.endpointing = None
+        elif endpointing == "adaptive":
+            self.endpointing = EndpointingPolicy(
+                min_silence_ms,
+                endpoint_min_silence_ms,
+                endpoint_max_silence_ms,
+                use_prosody=endpoint_prosody,
+                sample_rate=sample_rate,
+            )
+        elif endpointing == "fixed":
+            self.endpointing = None
+        else:
+            logger.warning(
+                f"Unknown endpointing {endpointing}, should be either fixed or adaptive. Reverting to 'fixed'"
+            )
+            self.endpointing = None
         self.model, _ = torch.hub.load("snakers4/silero-vad", "silero_vad")
         self.iterator = VADIterator(
             self.model,
@@ -196,19 +401,86 @@ class VADHandler(BaseHandler):
     def process(self, audio_chunk):
         audio_int16 = np.frombuffer(audio_chunk, dtype=np.int16)
         audio_float32 = int2float(audio_int16)
+        if self.endpointing is not None:
+            completeness = (
+                self.turn_hint.get(self.utterance_id, self.pause_samples)
+                if self.iterator.temp_end
+                else 0
+            )
+            self.iterator.min_silence_samples = (
+                self.sample_rate * self.endpointing.threshold_ms(completeness) / 1000
+            )
+        was_pausing = self.iterator.temp_end != 0
         vad_output = self.iterator(torch.from_numpy(audio_float32))
-        if vad_output is not None and len(vad_output) != 0:
-            logger.debug("VAD: end of speech detected")
-            array = torch.cat(vad_output).cpu().numpy()
-            duration_ms = len(array) / self.sample_rate * 1000
-            if duration_ms < self.min_speech_ms or duration_ms > self.max_speech_ms:
+        if vad_output is not None:
+            partials_sent = self.partial_samples > 0
+            self.partial_samples = 0
+            self.tentative_sent = False
+            self.utterance_id += 1
+            if len(vad_output) != 0:
+                logger.debug("VAD: end of speech detected")
+                if self.endpointing is not None:
+                    logger.debug(
+                        f"VAD: end of turn after {self.iterator.min_silence_samples / self.sample_rate * 1000:.0f} ms of silence, "
+                        f"{self.endpointing.describe()}"
+                    )
+                array = torch.cat(vad_output).cpu().numpy()
+                duration_ms = len(array) / self.sample_rate * 1000
+                if self.min_speech_ms <= duration_ms <= self.max_speech_ms:
+                    self.should_listen.clear()
+                    logger.debug("Stop listening")
+                    yield array
+                    return
                 logger.debug(
                     f"audio input of duration: {len(array) / self.sample_rate}s, skipping"
                 )
-            else:
-                self.should_listen.clear()
-                logger.debug("Stop listening")
-                yield array
+            if partials_sent:
+                yield PartialUtterance(None, self.utterance_id - 1)
+            return
+        if not self.iterator.triggered:
+            return
+
+        nb_samples = sum(len(chunk) for chunk in self.iterator.buffer)
+        if self.iterator.temp_end and not was_pausing:
+            self.pause_samples = nb_samples
+            if self.endpointing is not None:
+                self.endpointing.on_pause(torch.cat(self.iterator.buffer).cpu().numpy())
+        elif was_pausing and not self.iterator.temp_end and self.tentative_sent:
+            # the user went on speaking, a partial transcription discards the tentative one
+            self.tentative_sent = False
+            self.partial_samples = nb_samples
+            yield PartialUtterance(
+                torch.cat(self.iterator.buffer).cpu().numpy(), self.utterance_id
+            )
+            return
+
+        if (
+            self.tentative_silence_samples
+            and self.iterator.temp_end
+            and not self.tentative_sent
+            and self.iterator.current_sample - self.iterator.temp_end
+            >= self.tentative_silence_samples
+            and nb_samples >= self.min_speech_ms * self.sample_rate / 1000
+        ):
+            logger.debug("VAD: pause detected, sending a tentative transcription")
+            self.tentative_sent = True
+            self.partial_samples = nb_samples
+            yield PartialUtterance(
+                torch.cat(self.iterator.buffer).cpu().numpy(),
+                self.utterance_id,
+                tentative=True,
+            )
+        elif (
+            self.partial_interval_samples
+            # a partial transcription would discard the tentative one
+            and not self.tentative_sent
+            and nb_samples - self.partial_samples >= self.partial_interval_samples
+            and nb_samples >= self.min_speech_ms * self.sample_rate / 1000
+        ):
+            self.partial_samples = nb_samples
+            yield PartialUtterance(
+                torch.cat(self.iterator.buffer).cpu().numpy(), self.utterance_id
+            )
 
 
 class WhisperSTTHandler(BaseHandler):
@@ -218,23 +490,62 @@ class WhisperSTTHandler(BaseHandler):
 
     def setup(
         self,
+        turn_hint=None,
         model_name="distil-whisper/distil-large-v3",
         device="cuda",
         torch_dtype="float16",
         compile_mode=None,
+        quantization=None,
+        window_overlap_s=5.0,
+        max_batch_size=8,
+        budget_tokens_per_s=8.0,
+        budget_base_tokens=16,
         gen_kwargs={},
     ):
         self.device = device
-        self.torch_dtype = getattr(torch, torch_dtype)
+        self.quantization, self.torch_dtype = prepare_quantization(
+            quantization, device, resolve_torch_dtype(torch_dtype, device)
+        )
         self.compile_mode = compile_mode
         self.gen_kwargs = gen_kwargs
+        self.max_batch_size = max_batch_size
+        self.budget = (
+            GenerationBudget(
+                self.__class__.__name__,
+                budget_tokens_per_s,
+                budget_base_tokens,
+                gen_kwargs.get("max_new_tokens", 128),
+            )
+            if budget_tokens_per_s
+            else None
+        )
+        self.agreement = LocalAgreement()
+        self.turn_hint = turn_hint
+        # transcription of the utterance sent when the user paused, final if the pause ends the turn
+        self.tentative_text = None
 
         self.processor = AutoProcessor.from_pretrained(model_name)
+        self.feature_extractor = WhisperLogMel(self.processor.feature_extractor, device)
+        # longer utterances are split into overlapping windows of the model input length
+        self.window_samples = self.feature_extractor.n_samples
+        self.overlap_samples = int(window_overlap_s * 16000)
+        if not 0 <= self.overlap_samples < self.window_samples:
+            raise ValueError(
+                f"The window overlap should be at least 0 s and less than the {self.window_samples / 16000:.0f} s model input, got {window_overlap_s} s"
+            )
         self.model = AutoModelForSpeechSeq2Seq.from_pretrained(
             model_name,
             torch_dtype=self.torch_dtype,
         ).to(device)
 
+        if self.quantization:
+            self.model = quantize_dynamic_int8(self.model)
+            if self.compile_mode:
+                logger.warning(
+                    "Torch compilation is not compatible with dynamic int8 quantization. Running without compilation"
+                )
+                self.compile_mode = None
+
         # compile
         if self.compile_mode:
             self.model.generation_config.cache_implementation = "static"
@@ -244,12 +555,8 @@ class WhisperSTTHandler(BaseHandler):
         self.warmup()
 
     def prepare_model_inputs(self, spoken_prompt):
-        input_features = self.processor(
-            spoken_prompt, sampling_rate=16000, return_tensors="pt"
-        ).input_features
-        input_features = input_features.to(self.device, dtype=self.torch_dtype)
-
-        return input_features
+        input_features = self.feature_extractor([spoken_prompt])
+        return input_features.to(dtype=self.torch_dtype)
 
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
@@ -272,6 +579,7 @@ class WhisperSTTHandler(BaseHandler):
         else:
             warmup_gen_kwargs = self.gen_kwargs
 
+        start = perf_counter()
         if self.device == "cuda":
             start_event = torch.cuda.Event(enable_timing=True)
             end_event = torch.cuda.Event(enable_timing=True)
@@ -288,50 +596,156 @@ class WhisperSTTHandler(BaseHandler):
             logger.info(
                 f"{self.__class__.__name__}:  warmed up! time: {start_event.elapsed_time(end_event) * 1e-3:.3f} s"
             )
+        else:
+            logger.info(
+                f"{self.__class__.__name__}:  warmed up! time: {perf_counter() - start:.3f} s"
+            )
 
-    def process(self, spoken_prompt):
-        logger.debug("infering whisper...")
-
-        global pipeline_start
-        pipeline_start = perf_counter()
+    def generate(self, input_features, duration_s, prefix_ids=None, **gen_kwargs):
+        """
+        Runs generate with a `max_new_tokens` budget derived from `duration_s`, the duration of the longest input.
+        `prefix_ids` are forced as the start of the transcription: the budget only covers the tokens after them, which
+        transcribe the audio that they do not already cover.
+        """
+        gen_kwargs = {**self.gen_kwargs, **gen_kwargs}
+        nb_prefix_tokens = 0
+        if prefix_ids is not None:
+            # appended by generate after the start, language and task tokens
+            gen_kwargs["decoder_input_ids"] = prefix_ids.to(self.device)
+            nb_prefix_tokens = prefix_ids.shape[-1]
+        if self.budget is None:
+            return self.model.generate(input_features, **gen_kwargs)
+
+        budget = min(
+            max(
+                self.budget(duration_s) - nb_prefix_tokens,
+                self.budget.base_tokens,
+            ),
+            self.budget.max_new_tokens,
+        )
+        gen_kwargs["max_new_tokens"] = budget
+        pred_ids = self.model.generate(input_features, **gen_kwargs)
+        # Whisper special tokens come after the text tokens in the vocabulary
+        is_text = pred_ids < self.processor.tokenizer.eos_token_id
+        nb_new_tokens = is_text.sum(dim=-1).max().item()
+        # depending on the transformers version, forced tokens are part of the output or not
+        if nb_prefix_tokens and torch.equal(
+            pred_ids[0][is_text[0]][:nb_prefix_tokens].cpu(), prefix_ids[0]
+        ):
+            nb_new_tokens -= nb_prefix_tokens
+        self.budget.record(budget, nb_new_tokens >= budget)
+        return pred_ids
+
+    def transcribe(self, spoken_prompt, prefix=""):
+        """
+        Transcribes `spoken_prompt`, forcing the transcription to start with `prefix` so that only the rest is decoded.
+        """
+        if len(spoken_prompt) > self.window_samples:
+            return self.transcribe_long(spoken_prompt)
 
         input_features = self.prepare_model_inputs(spoken_prompt)
-        pred_ids = self.model.generate(input_features, **self.gen_kwargs)
+        prefix_ids = (
+            self.processor.tokenizer(
+                f" {prefix}", add_special_tokens=False, return_tensors="pt"
+            ).input_ids
+            if prefix
+            else None
+        )
+        pred_ids = self.generate(
+            input_features, len(spoken_prompt) / 16000, prefix_ids=prefix_ids
+        )
         pred_text = self.processor.batch_decode(
             pred_ids, skip_special_tokens=True, decode_with_timestamps=False
-        )[0]
-
-        logger.debug("finished whisper inference")
-        console.print(f"[yellow]USER: {pred_text}")
-
-        yield pred_text
+        )[0].strip()
+        # depending on the transformers version, forced tokens are part of the output or not
+        if prefix and not pred_text.startswith(prefix):
+            pred_text = f"{prefix} {pred_text}".strip()
+        return pred_text
+
+    def transcribe_long(self, spoken_prompt):
+        """
+        Transcribes an utterance longer than the model input by batches of overlapping windows, and merges the window
+        transcriptions at their overlaps.
+        """
+        windows = split_windows(spoken_prompt, self.window_samples, self.overlap_samples)
+        texts = []
+        for i in range(0, len(windows), self.max_batch_size):
+            batch = windows[i : i + self.max_batch_size]
+            input_features = self.feature_extractor(batch)
+            pred_ids = self.generate(
+                input_features.to(dtype=self.torch_dtype),
+                max(len(window) for window in batch) / 16000,
+            )
+            texts.extend(
+                self.processor.batch_decode(
+                    pred_ids, skip_special_tokens=True, decode_with_timestamps=False
+                )
+            )
+        logger.debug(
+            f"Transcribed a {len(spoken_prompt) / 16000:.1f} s utterance in {len(windows)} windows"
+        )
+        return merge_transcripts(texts)
+
+    def process_partial(self, partial):
+        if partial.utterance_id != self.agreement.utterance_id:
+            self.agreement.reset(partial.utterance_id)
+        if not partial.tentative:
+            self.tentative_text = None
+        if partial.audio is None:
+            # the VAD discarded the utterance
+            self.agreement.reset()
+            return
+        if not self.queue_in.empty():
+            # newer speech is already waiting, this hypothesis would be outdated before it is done
+            return
+        if len(partial.audio) > self.window_samples:
+            # committed words can only be forced on single window transcriptions
+            return
+
+        start = perf_counter()
+        pred_text = self.transcribe(partial.audio, prefix=self.agreement.committed_text)
+        nb_new_words = self.agreement.update(pred_text)
+        if partial.tentative:
+            self.tentative_text = pred_text
+        if self.turn_hint is not None:
+            self.turn_hint.set(
+                partial.utterance_id,
+                len(partial.audio),
+                transcript_completeness(pred_text),
+            )
+        logger.debug(
+            f"{'tentative' if partial.tentative else 'partial'} transcription in {perf_counter() - start:.3f} s, {nb_new_words} words committed: "
+            f"{self.agreement.committed_text!r} + {pred_text[len(self.agreement.committed_text) :]!r}"
+        )
 
+    def process(self, spoken_prompt):
+        if isinstance(spoken_prompt, PartialUtterance):
+            self.process_partial(spoken_prompt)
+            return
 
-class Chat:
-    """
-    Handles the chat using to avoid OOM issues.
-    """
+        logger.debug("infering whisper...")
 
-    def __init__(self, size):
-        self.size = size
-        self.init_chat_message = None
-        # maxlen is necessary pair, since a each new step we add an prompt and assitant answer
-        self.buffer = []
+        global pipeline_start
+        pipeline_start = perf_counter()
 
-    def append(self, item):
-        self.buffer.append(item)
-        if len(self.buffer) == 2 * (self.size + 1):
-            self.buffer.pop(0)
-            self.buffer.pop(0)
+        if self.tentative_text is not None:
+            # the user did not speak after the pause, the tentative transcription is the final one
+            logger.debug("end of turn confirmed the tentative transcription")
+            pred_text = self.tentative_text
+        else:
+            # the committed words of the partial transcriptions of this utterance are not decoded again
+            pred_text = self.transcribe(
+                spoken_prompt, prefix=self.agreement.committed_text
+            )
+        self.agreement.reset()
+        self.tentative_text = None
 
-    def init_chat(self, init_chat_message):
-        self.init_chat_message = init_chat_message
+        logger.debug(
+            f"finished whisper inference, real-time factor: {(perf_counter() - pipeline_start) * 16000 / len(spoken_prompt):.3f}"
+        )
+        console.print(f"[yellow]USER: {pred_text}")
 
-    def to_list(self):
-        if self.init_chat_message:
-            return [self.init_chat_message] + self.buffer
-        else:
-            return self.buffer
+        yield pred_text
 
 
 class LanguageModelHandler(BaseHandler):
@@ -339,39 +753,132 @@ class LanguageModelHandler(BaseHandler):
     Handles the language model part.
     """
 
+    # shortest padded prompt length, compiled prompt lengths are the powers of two from it to 2**(max_prompt_pad_length - 1)
+    MIN_PROMPT_PAD_LENGTH = 32
+
     def setup(
         self,
+        should_listen,
+        reply_progress=None,
         model_name="microsoft/Phi-3-mini-4k-instruct",
         device="cuda",
         torch_dtype="float16",
         gen_kwargs={},
         user_role="user",
         chat_size=1,
+        chat_max_tokens=None,
         init_chat_role=None,
         init_chat_prompt="You are a helpful AI assistant.",
+        chunking_policy="sentence",
+        first_chunk_min_words=4,
+        first_chunk_max_words=12,
+        chunk_growth_factor=2.0,
+        max_chunk_words=48,
+        reuse_kv_cache=True,
+        prefix_cache_mb=256,
+        compact_history=False,
+        compaction_max_new_tokens=96,
+        assistant_model_name=None,
+        num_assistant_tokens=5,
+        compile_mode=None,
+        max_prompt_pad_length=11,
+        quantization=None,
     ):
+        self.should_listen = should_listen
+        # None when no TTS speaks the replies, e.g. when the stage is replayed alone
+        self.reply_progress = reply_progress
+        # chunks yielded by the end of the last reply
+        self.reply_end = 0
         self.device = device
-        self.torch_dtype = getattr(torch, torch_dtype)
+        self.quantization, self.torch_dtype = prepare_quantization(
+            quantization, device, resolve_torch_dtype(torch_dtype, device)
+        )
+        self.compile_mode = compile_mode
+        self.max_prompt_pad_length = max_prompt_pad_length
 
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForCausalLM.from_pretrained(
-            model_name, torch_dtype=torch_dtype, trust_remote_code=True
+            model_name, torch_dtype=self.torch_dtype, trust_remote_code=True
         ).to(device)
-        self.pipe = pipeline(
-            "text-generation", model=self.model, tokenizer=self.tokenizer, device=device
-        )
-        self.streamer = TextIteratorStreamer(
-            self.tokenizer,
-            skip_prompt=True,
-            skip_special_tokens=True,
+        self.gen_kwargs = gen_kwargs
+
+        if self.quantization:
+            self.model = quantize_dynamic_int8(self.model)
+            if self.compile_mode:
+                logger.warning(
+                    "Torch compilation is not compatible with dynamic int8 quantization. Running without compilation"
+                )
+                self.compile_mode = None
+
+        if self.compile_mode:
+            if self.device != "cuda" and self.compile_mode != "default":
+                logger.warning(
+                    "Torch compilation modes that capture CUDA graphs require a CUDA device. Reverting to 'default'"
+                )
+                self.compile_mode = "default"
+            if reuse_kv_cache or prefix_cache_mb > 0 or assistant_model_name:
+                logger.warning(
+                    "KV cache reuse, prefix caching and speculative decoding are not compatible with the static cache used for compilation. Disabling them"
+                )
+                reuse_kv_cache, prefix_cache_mb, assistant_model_name = False, 0, None
+            # prompts are left padded to the closest upper power of two to limit the number of compiled graphs
+            self.tokenizer.padding_side = "left"
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            torch._inductor.config.fx_graph_cache = True
+            # one graph per padded prompt length, see warmup
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, 2 * max_prompt_pad_length
+            )
+            self.model.generation_config.cache_implementation = "static"
+            self.model.forward = torch.compile(
+                self.model.forward, mode=self.compile_mode, fullgraph=True
+            )
+        self.worker = GenerationWorker(
+            f"{self.__class__.__name__}-generate", cpu_resources=self.cpu_resources
         )
-        self.gen_kwargs = {
-            "streamer": self.streamer,
-            "return_full_text": False,
-            **gen_kwargs,
-        }
 
-        self.chat = Chat(chat_size)
+        self.acceptance_tracker = None
+        if assistant_model_name:
+            # the draft model proposes tokens that the main model verifies in a single forward pass
+            check_assistant_tokenizer(
+                self.tokenizer,
+                AutoTokenizer.from_pretrained(assistant_model_name),
+                assistant_model_name,
+            )
+            self.assistant_model = AutoModelForCausalLM.from_pretrained(
+                assistant_model_name,
+                torch_dtype=self.torch_dtype,
+                trust_remote_code=True,
+            ).to(device)
+            if self.quantization:
+                self.assistant_model = quantize_dynamic_int8(self.assistant_model)
+            self.assistant_model.generation_config.num_assistant_tokens = (
+                num_assistant_tokens
+            )
+            self.gen_kwargs["assistant_model"] = self.assistant_model
+            self.acceptance_tracker = AcceptanceTracker(
+                self.model, self.assistant_model
+            )
+
+        self.prefix_cache = PrefixCache(prefix_cache_mb) if prefix_cache_mb > 0 else None
+        if reuse_kv_cache or self.prefix_cache is not None:
+            self.kv_cache = SessionKVCache(
+                reuse_turns=reuse_kv_cache, prefix_cache=self.prefix_cache
+            )
+        else:
+            self.kv_cache = None
+
+        self.chat = Chat(
+            chat_size,
+            max_tokens=chat_max_tokens,
+            count_tokens=self.count_tokens,
+            keep_evicted=compact_history,
+        )
+        self.compact_history = compact_history
+        self.compaction_max_new_tokens = compaction_max_new_tokens
+        self.compaction_job = None
+        self.preempt_compaction = Event()
         if init_chat_role:
             if not init_chat_prompt:
                 raise ValueError(
@@ -379,8 +886,33 @@ class LanguageModelHandler(BaseHandler):
                 )
             self.chat.init_chat({"role": init_chat_role, "content": init_chat_prompt})
         self.user_role = user_role
+        self.text_chunker = build_text_chunker(
+            chunking_policy,
+            first_chunk_min_words=first_chunk_min_words,
+            first_chunk_max_words=first_chunk_max_words,
+            chunk_growth_factor=chunk_growth_factor,
+            max_chunk_words=max_chunk_words,
+        )
 
         self.warmup()
+        self.cache_chat_prefix()
+
+    def cache_chat_prefix(self):
+        """
+        Stores the KV states of the part of the prompt shared by every conversation in the prefix cache.
+        """
+        if self.prefix_cache is None or not self.chat.init_chat_message:
+            return
+        # the rendering of the system prompt can depend on the rest of the chat, only keep what two chats share
+        input_ids = [
+            self.prepare_model_inputs(
+                [self.chat.init_chat_message, {"role": self.user_role, "content": content}]
+            )["input_ids"][0]
+            for content in ("Hello!", "What time is it?")
+        ]
+        length = common_prefix_length(*input_ids)
+        if length > 0:
+            self.prefix_cache.add(self.model, input_ids[0][:length])
 
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
@@ -393,21 +925,41 @@ class LanguageModelHandler(BaseHandler):
             **self.gen_kwargs,
         }
 
-        n_steps = 2
+        # 2 warmup steps for no compile or compile mode with CUDA graphs capture
+        n_steps = 1 if self.compile_mode == "default" else 2
 
+        start = perf_counter()
         if self.device == "cuda":
             start_event = torch.cuda.Event(enable_timing=True)
             end_event = torch.cuda.Event(enable_timing=True)
             torch.cuda.synchronize()
             start_event.record()
 
-        for _ in range(n_steps):
-            thread = Thread(
-                target=self.pipe, args=(dummy_chat,), kwargs=warmup_gen_kwargs
-            )
-            thread.start()
-            for _ in self.streamer:
-                pass
+        if self.compile_mode:
+            pad_lengths = [
+                2**i
+                for i in range(
+                    self.MIN_PROMPT_PAD_LENGTH.bit_length() - 1,
+                    self.max_prompt_pad_length,
+                )
+            ]
+        else:
+            pad_lengths = [None]
+        for pad_length in pad_lengths[::-1]:
+            model_inputs = self.prepare_model_inputs(dummy_chat, pad_length=pad_length)
+            for _ in range(n_steps):
+                streamer = self.new_streamer()
+                job = self.worker.submit(
+                    self.model.generate,
+                    streamer=streamer,
+                    **model_inputs,
+                    **warmup_gen_kwargs,
+                )
+                for _ in streamer:
+                    pass
+                job.result()
+            if pad_length is not None:
+                logger.info(f"Warmed up length {pad_length} tokens!")
 
         if self.device == "cuda":
             end_event.record()
@@ -416,41 +968,194 @@ class LanguageModelHandler(BaseHandler):
             logger.info(
                 f"{self.__class__.__name__}:  warmed up! time: {start_event.elapsed_time(end_event) * 1e-3:.3f} s"
             )
+        else:
+            logger.info(
+                f"{self.__class__.__name__}:  warmed up! time: {perf_counter() - start:.3f} s"
+            )
+
+    def new_streamer(self):
+        return TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+        )
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def prepare_model_inputs(self, chat, pad_length=None):
+        if not self.compile_mode:
+            input_ids = self.tokenizer.apply_chat_template(
+                chat, add_generation_prompt=True, return_tensors="pt"
+            ).to(self.device)
+            return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+        prompt = self.tokenizer.apply_chat_template(
+            chat, add_generation_prompt=True, tokenize=False
+        )
+        if pad_length is None:
+            nb_tokens = len(self.tokenizer(prompt, add_special_tokens=False).input_ids)
+            # pad to closest upper power of two, short prompts to the shortest warmed up length
+            pad_length = max(self.MIN_PROMPT_PAD_LENGTH, next_power_of_2(nb_tokens))
+            if not (
+                self.MIN_PROMPT_PAD_LENGTH
+                <= pad_length
+                <= 2 ** (self.max_prompt_pad_length - 1)
+            ):
+                logger.warning(
+                    f"Prompt of {nb_tokens} tokens is padded to {pad_length}, outside of the warmed up lengths, this triggers a recompilation"
+                )
+            logger.debug(f"padding to {pad_length}")
+        return self.tokenizer(
+            prompt,
+            add_special_tokens=False,
+            padding="max_length",
+            max_length=pad_length,
+            return_tensors="pt",
+        ).to(self.device)
+
+    def generate(self, **kwargs):
+        if self.acceptance_tracker is not None:
+            self.acceptance_tracker.reset()
+
+        if self.kv_cache is None:
+            output_ids = self.model.generate(**kwargs)
+        else:
+            output_ids = generate_with_cache(
+                self.model, self.kv_cache, **kwargs
+            ).sequences
+
+        if self.acceptance_tracker is not None:
+            self.acceptance_tracker.report(
+                output_ids.shape[-1] - kwargs["input_ids"].shape[-1]
+            )
+        return output_ids
+
+    def chunk_sent(self):
+        if self.reply_progress is not None:
+            self.reply_end = self.reply_progress.chunk_sent()
+
+    def start_compaction(self):
+        if not self.compact_history or not self.chat.evicted:
+            return
+        self.preempt_compaction.clear()
+        self.compaction_job = self.worker.submit(self.compact)
+
+    def stop_compaction(self):
+        if self.compaction_job is None:
+            return
+        self.preempt_compaction.set()
+        try:
+            self.compaction_job.result()
+        except Exception as e:
+            # losing the summary is not worth failing the turn
+            logger.warning(f"History compaction failed: {e!r}")
+        self.compaction_job = None
+
+    def compaction_preempted(self):
+        # the VAD stops listening as soon as the user has finished speaking
+        return self.preempt_compaction.is_set() or not self.should_listen.is_set()
+
+    def compact(self):
+        """
+        Summarizes the evicted messages into the chat memory. Runs in the background once the reply has been spoken,
+        and gives up as soon as a new utterance needs the model.
+        """
+        # wait for the TTS to have spoken the last chunk of the reply
+        while self.reply_progress is not None and not self.reply_progress.spoken_up_to(
+            self.reply_end
+        ):
+            if self.preempt_compaction.wait(0.05):
+                return
+
+        start = perf_counter()
+        nb_evicted = len(self.chat.evicted)
+        chat = summary_request(
+            self.chat.memory, self.chat.evicted[:nb_evicted], self.user_role
+        )
+        model_inputs = self.prepare_model_inputs(chat)
+        output_ids = self.model.generate(
+            **model_inputs,
+            max_new_tokens=self.compaction_max_new_tokens,
+            do_sample=False,
+            stopping_criteria=StoppingCriteriaList(
+                [PreemptionCriteria(self.compaction_preempted)]
+            ),
+        )
+        if self.compaction_preempted():
+            logger.debug("History compaction preempted by a new utterance")
+            return
+
+        summary = self.tokenizer.decode(
+            output_ids[0, model_inputs["input_ids"].shape[-1] :],
+            skip_special_tokens=True,
+        ).strip()
+        self.chat.set_memory(memory_messages(summary, self.user_role), nb_evicted)
+        logger.debug(
+            f"Compacted {nb_evicted} messages in {perf_counter() - start:.3f} s: {summary}"
+        )
 
     def process(self, prompt):
         logger.debug("infering language model...")
 
+        self.stop_compaction()
         self.chat.append({"role": self.user_role, "content": prompt})
-        thread = Thread(
-            target=self.pipe, args=(self.chat.to_list(),), kwargs=self.gen_kwargs
+        model_inputs = self.prepare_model_inputs(self.chat.to_list())
+        logger.debug(
+            f"Chat history: {self.chat.prompt_length} message tokens, {model_inputs['input_ids'].shape[-1]} prompt tokens"
+        )
+        streamer = self.new_streamer()
+        job = self.worker.submit(
+            self.generate,
+            streamer=streamer,
+            **model_inputs,
+            **self.gen_kwargs,
         )
-        thread.start()
         if self.device == "mps":
             generated_text = ""
-            for new_text in self.streamer:
+            nb_sentences = 0
+            for new_text in streamer:
                 generated_text += new_text
             printable_text = generated_text
             torch.mps.empty_cache()
         else:
-            generated_text, printable_text = "", ""
-            for new_text in self.streamer:
+            generated_text = ""
+            nb_sentences = 0
+            for new_text in streamer:
                 generated_text += new_text
-                printable_text += new_text
-                sentences = sent_tokenize(printable_text)
-                if len(sentences) > 1:
-                    yield (sentences[0])
-                    printable_text = new_text
+                for sentence in self.text_chunker.push(new_text):
+                    if nb_sentences == 0 and "pipeline_start" in globals():
+                        logger.info(
+                            f"Time to first text chunk: {perf_counter() - pipeline_start:.3f}"
+                        )
+                    nb_sentences += 1
+                    logger.debug(f"LM chunk {nb_sentences}: {len(sentence.split())} words")
+                    self.chunk_sent()
+                    yield sentence
+            printable_text = self.text_chunker.flush()
+        # raises the generation error if any, and makes sure the cache of this turn is stored
+        job.result()
 
         self.chat.append({"role": "assistant", "content": generated_text})
 
-        # don't forget last sentence
-        yield printable_text
+        # don't forget last sentence, the TTS needs at least one input per turn to start listening again
+        if printable_text or nb_sentences == 0:
+            self.chunk_sent()
+            yield printable_text
+        # only once the last chunk of the reply is out, so that compaction never runs ahead of it
+        self.start_compaction()
+
+    def cleanup(self):
+        self.stop_compaction()
+        self.worker.stop()
 
 
 class ParlerTTSHandler(BaseHandler):
     def setup(
         self,
         should_listen,
+        output_sample_rate=None,
+        reply_progress=None,
         model_name="ylacombe/parler-tts-mini-jenny-30H",
         device="cuda",
         torch_dtype="float16",
@@ -461,26 +1166,67 @@ class ParlerTTSHandler(BaseHandler):
             "A female speaker with a slightly low-pitched voice delivers her words quite expressively, in a very confined sounding environment with clear audio quality. "
             "She speaks very fast."
         ),
-        play_steps_s=1,
+        play_steps_s=0.5,
+        play_steps_growth=2.0,
+        max_play_steps_s=2.0,
         blocksize=512,
+        audio_cache_mb=0,
+        audio_cache_dir=None,
+        audio_cache_max_words=16,
+        masking_threshold_s=None,
+        masking_phrases="Hmm.|Let me see.|Okay.",
+        budget_s_per_char=0.1,
+        budget_base_s=1.0,
     ):
         self.should_listen = should_listen
+        self.output_sample_rate = output_sample_rate or OutputSampleRate()
+        self.reply_progress = reply_progress or ReplyProgress()
         self.device = device
-        self.torch_dtype = getattr(torch, torch_dtype)
+        self.torch_dtype = resolve_torch_dtype(torch_dtype, device)
         self.gen_kwargs = gen_kwargs
         self.compile_mode = compile_mode
         self.max_prompt_pad_length = max_prompt_pad_length
         self.description = description
 
+        torch._inductor.config.fx_graph_cache = True
+        # mind about this parameter ! should be >= 2 * number of padded prompt sizes for TTS
+        torch._dynamo.config.cache_size_limit = max(
+            torch._dynamo.config.cache_size_limit, 15
+        )
+
         self.description_tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.prompt_tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = ParlerTTSForConditionalGeneration.from_pretrained(
             model_name, torch_dtype=self.torch_dtype
         ).to(device)
+        self.voice_cache = VoiceCache(self.description_tokenizer, description, device)
+        self.voice_cache.attach(self.model.text_encoder)
+        self.audio_cache = (
+            AudioCache(audio_cache_mb, audio_cache_dir, audio_cache_max_words)
+            if audio_cache_mb > 0
+            else None
+        )
 
         framerate = self.model.audio_encoder.config.frame_rate
+        self.sampling_rate = self.model.audio_encoder.config.sampling_rate
         self.play_steps = int(framerate * play_steps_s)
+        self.play_steps_growth = play_steps_growth
+        self.max_play_steps = int(framerate * max_play_steps_s)
+        self.budget = (
+            GenerationBudget(
+                self.__class__.__name__,
+                framerate * budget_s_per_char,
+                framerate * budget_base_s,
+                gen_kwargs.get("max_new_tokens", 512),
+                min_new_tokens=gen_kwargs.get("min_new_tokens", 0),
+            )
+            if budget_s_per_char
+            else None
+        )
         self.blocksize = blocksize
+        self.worker = GenerationWorker(
+            f"{self.__class__.__name__}-generate", cpu_resources=self.cpu_resources
+        )
 
         if self.compile_mode not in (None, "default"):
             logger.warning(
@@ -496,6 +1242,19 @@ class ParlerTTSHandler(BaseHandler):
 
         self.warmup()
 
+        self.latency_masker = None
+        if masking_threshold_s is not None:
+            clips = [self.render(phrase) for phrase in masking_phrases.split("|")]
+            self.latency_masker = LatencyMasker(
+                should_listen,
+                self.queue_out,
+                clips,
+                self.sampling_rate,
+                self.output_sample_rate,
+                threshold_s=masking_threshold_s,
+                blocksize=blocksize,
+            )
+
     def prepare_model_inputs(
         self,
         prompt,
@@ -506,11 +1265,7 @@ class ParlerTTSHandler(BaseHandler):
             {"padding": "max_length", "max_length": max_length_prompt} if pad else {}
         )
 
-        tokenized_description = self.description_tokenizer(
-            self.description, return_tensors="pt"
-        )
-        input_ids = tokenized_description.input_ids.to(self.device)
-        attention_mask = tokenized_description.attention_mask.to(self.device)
+        input_ids, attention_mask = self.voice_cache.inputs()
 
         tokenized_prompt = self.prompt_tokenizer(
             prompt, return_tensors="pt", **pad_args_prompt
@@ -528,6 +1283,24 @@ class ParlerTTSHandler(BaseHandler):
 
         return gen_kwargs
 
+    def pad_args(self, text):
+        if not self.compile_mode:
+            return {}
+        # pad to closest upper power of two
+        pad_length = next_power_of_2(len(self.prompt_tokenizer(text).input_ids))
+        logger.debug(f"padding to {pad_length}")
+        return {"pad": True, "max_length_prompt": pad_length}
+
+    def render(self, text):
+        """
+        Synthesizes `text` in one go, as a float waveform at the model sampling rate.
+        """
+        torch.manual_seed(0)
+        audio = self.model.generate(
+            **self.prepare_model_inputs(text, **self.pad_args(text))
+        )
+        return audio.float().cpu().numpy().squeeze()
+
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
 
@@ -564,43 +1337,80 @@ class ParlerTTSHandler(BaseHandler):
 
     def process(self, llm_sentence):
         console.print(f"[green]ASSISTANT: {llm_sentence}")
-        nb_tokens = len(self.prompt_tokenizer(llm_sentence).input_ids)
 
-        pad_args = {}
-        if self.compile_mode:
-            # pad to closest upper power of two
-            pad_length = next_power_of_2(nb_tokens)
-            logger.debug(f"padding to {pad_length}")
-            pad_args["pad"] = True
-            pad_args["max_length_prompt"] = pad_length
+        output_rate = self.output_sample_rate.get()
+        cache_key = None
+        if self.audio_cache is not None:
+            cache_key = self.audio_cache.key(llm_sentence, self.description, output_rate)
+            audio = self.audio_cache.get(cache_key) if cache_key else None
+            if audio is not None:
+                if "pipeline_start" in globals():
+                    logger.info(
+                        f"Time to first audio: {perf_counter() - pipeline_start:.3f}"
+                    )
+                if self.latency_masker is not None:
+                    self.latency_masker.response_started()
+                yield from split_blocks(audio, self.blocksize)
+                self.should_listen.set()
+                self.reply_progress.chunk_spoken()
+                return
 
         tts_gen_kwargs = self.prepare_model_inputs(
             llm_sentence,
-            **pad_args,
+            **self.pad_args(llm_sentence),
         )
+        if self.budget is not None:
+            # audio tokens to generate, from the number of characters to speak
+            budget = self.budget(len(llm_sentence))
+            tts_gen_kwargs["max_new_tokens"] = budget
 
-        streamer = ParlerTTSStreamer(
-            self.model, device=self.device, play_steps=self.play_steps
+        streamer = AdaptiveParlerTTSStreamer(
+            self.model,
+            device=self.device,
+            play_steps=self.play_steps,
+            growth=self.play_steps_growth,
+            max_play_steps=self.max_play_steps,
         )
-        tts_gen_kwargs = {"streamer": streamer, **tts_gen_kwargs}
         torch.manual_seed(0)
-        thread = Thread(target=self.model.generate, kwargs=tts_gen_kwargs)
-        thread.start()
+        job = self.worker.submit(
+            self.model.generate, streamer=streamer, **tts_gen_kwargs
+        )
 
+        audio_chunks = []
         for i, audio_chunk in enumerate(streamer):
             if i == 0 and "pipeline_start" in globals():
                 logger.info(
                     f"Time to first audio: {perf_counter() - pipeline_start:.3f}"
                 )
-            audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
-            audio_chunk = (audio_chunk * 32768).astype(np.int16)
-            for i in range(0, len(audio_chunk), self.blocksize):
-                yield np.pad(
-                    audio_chunk[i : i + self.blocksize],
-                    (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
+            if output_rate != self.sampling_rate:
+                audio_chunk = librosa.resample(
+                    audio_chunk, orig_sr=self.sampling_rate, target_sr=output_rate
                 )
-
+            audio_chunk = (audio_chunk * 32768).astype(np.int16)
+            if cache_key:
+                audio_chunks.append(audio_chunk)
+            if i == 0 and self.latency_masker is not None:
+                self.latency_masker.response_started()
+            yield from split_blocks(audio_chunk, self.blocksize)
+
+        # raises the generation error if any
+        job.result()
+        budget_hit = False
+        if self.budget is not None and streamer.token_cache is not None:
+            # the streamer also received the decoder start tokens
+            nb_new_tokens = streamer.token_cache.shape[-1] - 1
+            budget_hit = nb_new_tokens >= budget
+            self.budget.record(budget, budget_hit)
+        # audio cut by the budget would be replayed for every later occurrence of the sentence
+        if cache_key and audio_chunks and not budget_hit:
+            self.audio_cache.put(cache_key, np.concatenate(audio_chunks))
         self.should_listen.set()
+        self.reply_progress.chunk_spoken()
+
+    def cleanup(self):
+        self.worker.stop()
+        if self.latency_masker is not None:
+            self.latency_masker.stop()
 
 
 def prepare_args(args, prefix):
@@ -627,6 +1437,9 @@ def main():
             ModuleArguments,
             SocketReceiverArguments,
             SocketSenderArguments,
+            SessionRecorderArguments,
+            HealthArguments,
+            StageResourcesArguments,
             VADHandlerArguments,
             WhisperSTTHandlerArguments,
             LanguageModelHandlerArguments,
@@ -643,6 +1456,9 @@ def main():
             module_kwargs,
             socket_receiver_kwargs,
             socket_sender_kwargs,
+            session_recorder_kwargs,
+            health_kwargs,
+            stage_resources_kwargs,
             vad_handler_kwargs,
             whisper_stt_handler_kwargs,
             language_model_handler_kwargs,
@@ -656,6 +1472,9 @@ def main():
             module_kwargs,
             socket_receiver_kwargs,
             socket_sender_kwargs,
+            session_recorder_kwargs,
+            health_kwargs,
+            stage_resources_kwargs,
             vad_handler_kwargs,
             whisper_stt_handler_kwargs,
             language_model_handler_kwargs,
@@ -736,18 +1555,99 @@ def main():
     prepare_args(melo_tts_handler_kwargs, "melo")
 
     # 3. Build the pipeline
-    stop_event = Event()
+    stage_names = ("vad", "stt", "lm", "tts")
+    if module_kwargs.stage_isolation == "process":
+        # stages run in spawned processes, everything they share has to come from the same context
+        context = multiprocessing.get_context("spawn")
+        new_event = context.Event
+        stage_groups = (
+            [group.split("+") for group in module_kwargs.stage_groups.split(",")]
+            if module_kwargs.stage_groups
+            else [[stage] for stage in stage_names]
+        )
+        if sorted(sum(stage_groups, [])) != sorted(stage_names):
+            raise ValueError(
+                "The stage groups should contain each of vad, stt, lm and tts once"
+            )
+        stage_group = {stage: i for i, group in enumerate(stage_groups) for stage in group}
+
+        def new_queue(name, producer, consumer, audio):
+            if stage_group.get(producer, -1) == stage_group.get(consumer, -2):
+                return GroupLocalQueue(name, context)
+            if audio:
+                return SharedAudioQueue(context, module_kwargs.audio_buffer_mb)
+            return context.Queue()
+
+    elif module_kwargs.stage_isolation == "thread":
+        context = None
+        new_event = Event
+
+        def new_queue(name, producer, consumer, audio):
+            return Queue()
+
+    else:
+        raise ValueError("The stage isolation should be either thread or process")
+
+    stage_resources = {
+        stage: CPUResources(
+            num_threads=getattr(stage_resources_kwargs, f"{stage}_num_threads"),
+            num_interop_threads=getattr(
+                stage_resources_kwargs, f"{stage}_num_interop_threads"
+            ),
+            cpu_affinity=getattr(stage_resources_kwargs, f"{stage}_cpu_affinity"),
+        )
+        for stage in stage_names
+    }
+    stage_statuses = {stage: StageStatus() for stage in stage_names}
+
+    stop_event = new_event()
     # used to stop putting received audio chunks in queue until all setences have been processed by the TTS
-    should_listen = Event()
-    recv_audio_chunks_queue = Queue()
-    send_audio_chunks_queue = Queue()
-    spoken_prompt_queue = Queue()
-    text_prompt_queue = Queue()
-    lm_response_queue = Queue()
+    should_listen = new_event()
+    # playback rate of the client, the local streamer always plays at 16kHz
+    output_sample_rate = OutputSampleRate(default=16000)
+    # completeness of the partial transcriptions, used by the VAD to detect the end of turns
+    turn_hint = TurnHint()
+    # tells the LM when the TTS has spoken its reply, to compact the history only while waiting on the user
+    reply_progress = ReplyProgress()
+    # audio goes through shared memory between processes, text through pipes
+    recv_audio_chunks_queue = new_queue("recv_audio_chunks", "comms", "vad", audio=True)
+    send_audio_chunks_queue = new_queue("send_audio_chunks", "tts", "comms", audio=True)
+    spoken_prompt_queue = new_queue("spoken_prompt", "vad", "stt", audio=True)
+    text_prompt_queue = new_queue("text_prompt", "stt", "lm", audio=False)
+    lm_response_queue = new_queue("lm_response", "lm", "tts", audio=False)
+
+    # the communication handlers record the inbound and outbound audio
+    comms_recv_queue, comms_send_queue = recv_audio_chunks_queue, send_audio_chunks_queue
+    if session_recorder_kwargs.record_dir is not None:
+        os.makedirs(session_recorder_kwargs.record_dir, exist_ok=True)
+        recorder = SessionRecorder(
+            os.path.join(
+                session_recorder_kwargs.record_dir,
+                f"session_{strftime('%Y%m%d_%H%M%S')}.s2s",
+            ),
+            buffer_size=session_recorder_kwargs.record_buffer_size,
+        )
+        # writes what is still buffered once the pipeline threads are done
+        atexit.register(recorder.stop)
+        comms_recv_queue = RecordingQueue(recv_audio_chunks_queue, recorder, "input")
+        comms_send_queue = RecordingQueue(
+            send_audio_chunks_queue, recorder, "output", on="get"
+        )
+        stage_recorder = recorder
+        if context is not None:
+            # stages running in their own process send what they record to the main process
+            stage_recorder = RecordingSink(recorder, context)
+            # registered last to run first, the recorder then writes what the sink handed over
+            atexit.register(stage_recorder.stop)
+        spoken_prompt_queue = RecordingQueue(spoken_prompt_queue, stage_recorder, "vad")
+        text_prompt_queue = RecordingQueue(
+            text_prompt_queue, stage_recorder, "transcript"
+        )
+        lm_response_queue = RecordingQueue(lm_response_queue, stage_recorder, "llm")
 
     if module_kwargs.mode == "local":
         local_audio_streamer = LocalAudioStreamer(
-            input_queue=recv_audio_chunks_queue, output_queue=send_audio_chunks_queue
+            input_queue=comms_recv_queue, output_queue=comms_send_queue
         )
         comms_handlers = [local_audio_streamer]
         should_listen.set()
@@ -755,7 +1655,7 @@ def main():
         comms_handlers = [
             SocketReceiver(
                 stop_event,
-                recv_audio_chunks_queue,
+                comms_recv_queue,
                 should_listen,
                 host=socket_receiver_kwargs.recv_host,
                 port=socket_receiver_kwargs.recv_port,
@@ -763,63 +1663,87 @@ def main():
             ),
             SocketSender(
                 stop_event,
-                send_audio_chunks_queue,
+                comms_send_queue,
+                output_sample_rate,
                 host=socket_sender_kwargs.send_host,
                 port=socket_sender_kwargs.send_port,
+                rate_handshake_timeout_s=socket_sender_kwargs.rate_handshake_timeout_s,
             ),
         ]
 
-    vad = VADHandler(
+    vad = partial(
+        VADHandler,
         stop_event,
         queue_in=recv_audio_chunks_queue,
         queue_out=spoken_prompt_queue,
-        setup_args=(should_listen,),
+        # only the transformers Whisper handler reports the completeness of its transcriptions
+        setup_args=(
+            should_listen,
+            turn_hint if module_kwargs.stt == "whisper" else None,
+        ),
         setup_kwargs=vars(vad_handler_kwargs),
+        cpu_resources=stage_resources["vad"],
+        stage_status=stage_statuses["vad"],
     )
     if module_kwargs.stt == "whisper":
-        stt = WhisperSTTHandler(
+        stt = partial(
+            WhisperSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
+            setup_args=(turn_hint,),
             setup_kwargs=vars(whisper_stt_handler_kwargs),
+            cpu_resources=stage_resources["stt"],
+            stage_status=stage_statuses["stt"],
         )
     elif module_kwargs.stt == "whisper-mlx":
         from STT.lightning_whisper_mlx_handler import LightningWhisperSTTHandler
-        stt = LightningWhisperSTTHandler(
+        stt = partial(
+            LightningWhisperSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
+            setup_args=(turn_hint,),
             setup_kwargs=vars(whisper_stt_handler_kwargs),
+            cpu_resources=stage_resources["stt"],
+            stage_status=stage_statuses["stt"],
         )
     else:
         raise ValueError("The STT should be either whisper or whisper-mlx")
     if module_kwargs.llm == "transformers":
-        lm = LanguageModelHandler(
+        lm = partial(
+            LanguageModelHandler,
             stop_event,
             queue_in=text_prompt_queue,
             queue_out=lm_response_queue,
+            setup_args=(should_listen, reply_progress),
             setup_kwargs=vars(language_model_handler_kwargs),
+            cpu_resources=stage_resources["lm"],
+            stage_status=stage_statuses["lm"],
         )
     elif module_kwargs.llm == "mlx-lm":
         from LLM.mlx_lm import MLXLanguageModelHandler
-        lm = MLXLanguageModelHandler(
+        lm = partial(
+            MLXLanguageModelHandler,
             stop_event,
             queue_in=text_prompt_queue,
             queue_out=lm_response_queue,
             setup_kwargs=vars(mlx_language_model_handler_kwargs),
+            cpu_resources=stage_resources["lm"],
+            stage_status=stage_statuses["lm"],
         )
     else:
         raise ValueError("The LLM should be either transformers or mlx-lm")
     if module_kwargs.tts == "parler":
-        torch._inductor.config.fx_graph_cache = True
-        # mind about this parameter ! should be >= 2 * number of padded prompt sizes for TTS
-        torch._dynamo.config.cache_size_limit = 15
-        tts = ParlerTTSHandler(
+        tts = partial(
+            ParlerTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
-            setup_args=(should_listen,),
+            setup_args=(should_listen, output_sample_rate, reply_progress),
             setup_kwargs=vars(parler_tts_handler_kwargs),
+            cpu_resources=stage_resources["tts"],
+            stage_status=stage_statuses["tts"],
         )
 
     elif module_kwargs.tts == "melo":
@@ -830,20 +1754,54 @@ def main():
                 "Error importing MeloTTSHandler. You might need to run: python -m unidic download"
             )
             raise e
-        tts = MeloTTSHandler(
+        tts = partial(
+            MeloTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
-            setup_args=(should_listen,),
+            setup_args=(should_listen, output_sample_rate, reply_progress),
             setup_kwargs=vars(melo_tts_handler_kwargs),
+            cpu_resources=stage_resources["tts"],
+            stage_status=stage_statuses["tts"],
         )
     else:
         raise ValueError("The TTS should be either parler or melo")
 
     # 4. Run the pipeline
+    stages = {"vad": vad, "stt": stt, "lm": lm, "tts": tts}
+    if health_kwargs.health_port is not None:
+        # started before the stages are built, so that orchestrators see them loading
+        health_server = HealthServer(
+            stage_statuses,
+            {
+                "recv_audio_chunks": recv_audio_chunks_queue,
+                "spoken_prompt": spoken_prompt_queue,
+                "text_prompt": text_prompt_queue,
+                "lm_response": lm_response_queue,
+                "send_audio_chunks": send_audio_chunks_queue,
+            },
+            comms_handlers,
+            host=health_kwargs.health_host,
+            port=health_kwargs.health_port,
+            max_backlog=health_kwargs.health_max_backlog,
+        )
+        health_server.start()
     try:
-        pipeline_manager = ThreadManager([*comms_handlers, vad, stt, lm, tts])
+        if context is not None:
+            pipeline_manager = ProcessManager(
+                stop_event,
+                comms_handlers,
+                [[stages[stage] for stage in group] for group in stage_groups],
+                module_kwargs.log_level,
+                context,
+            )
+        else:
+            pipeline_manager = ThreadManager(
+                [*comms_handlers, *[build_handler() for build_handler in stages.values()]]
+            )
         pipeline_manager.start()
+        if health_kwargs.health_port is not None:
+            health_server.set_manager(pipeline_manager)
 
     except KeyboardInterrupt:
         pipeline_manager.stop()
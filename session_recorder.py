@@ -0,0 +1,215 @@
+import logging
+import mmap
+import struct
+import threading
+from queue import Empty, Full, Queue
+from time import perf_counter, time
+
+import numpy as np
+
+from STT.streaming import PartialUtterance
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"S2SREC1\n"
+# wall clock time of the start of the recording
+FILE_HEADER = struct.Struct("<d")
+# seconds since the start of the recording, stream, payload kind, payload size in bytes
+RECORD_HEADER = struct.Struct("<dBBI")
+# utterance id and whether a partial utterance is tentative and has audio, followed by its float32 audio
+PARTIAL_HEADER = struct.Struct("<i??")
+
+STREAMS = ("input", "vad", "transcript", "llm", "output")
+PCM16, FLOAT32, TEXT, PARTIAL = range(4)
+
+
+def encode_payload(item):
+    """
+    Returns the kind and bytes of an item of a pipeline queue, or None for items that are not recorded, e.g. b"END".
+    """
+    if isinstance(item, str):
+        return TEXT, item.encode()
+    if isinstance(item, bytes):
+        return (PCM16, item) if item != b"END" else None
+    if isinstance(item, np.ndarray):
+        if item.dtype == np.int16:
+            return PCM16, item.tobytes()
+        return FLOAT32, item.astype(np.float32).tobytes()
+    if isinstance(item, PartialUtterance):
+        header = PARTIAL_HEADER.pack(
+            item.utterance_id, item.tentative, item.audio is not None
+        )
+        if item.audio is None:
+            return PARTIAL, header
+        return PARTIAL, header + np.asarray(item.audio, dtype=np.float32).tobytes()
+    return None
+
+
+class SessionRecorder:
+    """
+    Records what flows between the pipeline stages into an append-only file: inbound PCM, VAD segments and partial
+    utterances, transcripts, LM sentences and outbound audio, each with its time since the start of the recording.
+
+    `record` only timestamps the item and hands it over to a writer thread through a queue of `buffer_size` items.
+    When the writer falls behind, items are dropped and counted rather than slowing down the caller.
+
+    The file starts with `MAGIC` and a `FILE_HEADER`, followed by records made of a `RECORD_HEADER` and a payload.
+    `read_session` maps it in memory and returns payloads as views on the file.
+    """
+
+    def __init__(self, path, buffer_size=1024):
+        self.path = path
+        self.items = Queue(maxsize=buffer_size)
+        self.dropped = 0
+        self.start = perf_counter()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + FILE_HEADER.pack(time()))
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        logger.info(f"Recording the session to {path}")
+
+    def record(self, stream, item, timestamp=None):
+        """
+        Records `item` in `stream`, at `timestamp` as given by `perf_counter` if specified, else now.
+        """
+        if timestamp is None:
+            timestamp = perf_counter()
+        try:
+            self.items.put_nowait((timestamp - self.start, stream, item))
+        except Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(
+                    f"Session recorder is falling behind, {self.dropped} items dropped"
+                )
+
+    def run(self):
+        while True:
+            try:
+                entry = self.items.get(timeout=1)
+            except Empty:
+                self.file.flush()
+                continue
+            if entry is None:
+                break
+            timestamp, stream, item = entry
+            payload = encode_payload(item)
+            if payload is None:
+                continue
+            kind, data = payload
+            self.file.write(
+                RECORD_HEADER.pack(timestamp, STREAMS.index(stream), kind, len(data))
+            )
+            self.file.write(data)
+        self.file.close()
+
+    def stop(self):
+        self.items.put(None)
+        self.thread.join()
+
+
+class RecordingSink:
+    """
+    Records the items of stages running in their own process: `record` sends them, timestamped, through a
+    multiprocessing queue of `context` to a thread of the main process, which hands them over to `recorder`. The
+    timestamps of `perf_counter` are taken from a system wide clock, and compare across processes.
+    """
+
+    def __init__(self, recorder, context):
+        self.recorder = recorder
+        self.queue = context.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __getstate__(self):
+        return {"queue": self.queue}
+
+    def record(self, stream, item):
+        self.queue.put((perf_counter(), stream, item))
+
+    def run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            timestamp, stream, item = entry
+            self.recorder.record(stream, item, timestamp)
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class RecordingQueue:
+    """
+    Queue wrapper recording the items put in, or taken out of, `queue` into the `stream` of a `SessionRecorder`, or of
+    a `RecordingSink` when the queue is used by stages running in their own process.
+    """
+
+    def __init__(self, queue, recorder, stream, on="put"):
+        self.queue = queue
+        self.recorder = recorder
+        self.stream = stream
+        self.on = on
+
+    def put(self, item, *args, **kwargs):
+        self.queue.put(item, *args, **kwargs)
+        if self.on == "put":
+            self.recorder.record(self.stream, item)
+
+    def get(self, *args, **kwargs):
+        item = self.queue.get(*args, **kwargs)
+        if self.on == "get":
+            self.recorder.record(self.stream, item)
+        return item
+
+    def __getattr__(self, name):
+        if name == "queue":
+            # not set yet while unpickling
+            raise AttributeError(name)
+        return getattr(self.queue, name)
+
+
+def read_session(path):
+    """
+    Returns the start time of a recording and its records, as (time since start, stream, payload) tuples. Audio
+    payloads are numpy arrays backed by the memory-mapped file, partial utterances are rebuilt as `PartialUtterance`
+    around such arrays.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a session recording")
+    (start_time,) = FILE_HEADER.unpack_from(buffer, len(MAGIC))
+
+    records = []
+    offset = len(MAGIC) + FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= len(buffer):
+        timestamp, stream, kind, size = RECORD_HEADER.unpack_from(buffer, offset)
+        offset += RECORD_HEADER.size
+        if offset + size > len(buffer):
+            # truncated last record of an interrupted recording
+            break
+        if kind == TEXT:
+            payload = bytes(buffer[offset : offset + size]).decode()
+        elif kind == PARTIAL:
+            utterance_id, tentative, has_audio = PARTIAL_HEADER.unpack_from(
+                buffer, offset
+            )
+            audio = None
+            if has_audio:
+                audio = np.frombuffer(
+                    buffer,
+                    dtype=np.float32,
+                    count=(size - PARTIAL_HEADER.size) // 4,
+                    offset=offset + PARTIAL_HEADER.size,
+                )
+            payload = PartialUtterance(audio, utterance_id, tentative=tentative)
+        else:
+            dtype = np.int16 if kind == PCM16 else np.float32
+            payload = np.frombuffer(
+                buffer, dtype=dtype, count=size // np.dtype(dtype).itemsize, offset=offset
+            )
+        records.append((timestamp, STREAMS[stream], payload))
+        offset += size
+    return start_time, records
@@ -0,0 +1,173 @@
+import copy
+import os
+import threading
+from queue import Queue
+
+import numpy as np
+
+
+class AudioRef:
+    """
+    Location of an audio payload in the ring buffer of a `SharedAudioQueue`. `dtype` is None for PCM bytes.
+    """
+
+    def __init__(self, start, nbytes, dtype, shape):
+        self.start = start
+        self.nbytes = nbytes
+        self.dtype = dtype
+        self.shape = shape
+
+
+class GroupLocalQueue:
+    """
+    Queue between two stages that run in the same process. A `queue.Queue` cannot be handed to a spawned process, so
+    the underlying queue is created when the stages of the group are unpickled in their process, where both share it.
+    The number of items is kept in shared memory, so that the backlog can be read from the main process.
+    """
+
+    def __init__(self, name, context):
+        self.name = name
+        self.size = context.Value("i", 0)
+        self.queue = Queue()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["queue"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.queue = Queue()
+
+    def put(self, item, block=True, timeout=None):
+        with self.size.get_lock():
+            self.size.value += 1
+        self.queue.put(item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        item = self.queue.get(block, timeout)
+        with self.size.get_lock():
+            self.size.value -= 1
+        return item
+
+    def qsize(self):
+        return self.size.value
+
+    def empty(self):
+        return self.qsize() == 0
+
+
+class SharedAudioQueue:
+    """
+    Multiprocessing queue for audio. Numpy arrays and PCM bytes are copied into a shared memory ring buffer of
+    `capacity_mb`, and only their `AudioRef` goes through the pipe of the underlying queue, along with the other, small,
+    items. The `audio` of items such as `STT.streaming.PartialUtterance` is passed the same way. This saves pickling the
+    audio and copying it through the pipe, and keeps the consumer from holding the GIL while it unpickles it.
+
+    Audio that does not fit in the free part of the ring is sent through the pipe, so producers never wait for the
+    consumer. Items are read in order by a single consumer, which frees the ring as it goes. Producers may be several
+    threads, but of a single process: ring positions are shared without cross-process synchronization, so the first
+    process to put, and the first to get, own their side of the queue and any other process raises a RuntimeError.
+    """
+
+    def __init__(self, context, capacity_mb=8):
+        self.queue = context.Queue()
+        self.capacity = int(capacity_mb * 2**20)
+        self.buffer = context.RawArray("B", self.capacity)
+        # bytes written and read since the start, the ring holds what is in between
+        self.write_pos = context.RawValue("q", 0)
+        self.read_pos = context.RawValue("q", 0)
+        self.producer_pid = context.Value("i", 0)
+        self.consumer_pid = context.Value("i", 0)
+        self.init_local()
+
+    def init_local(self):
+        self.lock = threading.Lock()
+        self.owned = set()
+        self.view = np.frombuffer(self.buffer, dtype=np.uint8)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"], state["view"], state["owned"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init_local()
+
+    def claim(self, side, owner_pid):
+        if side in self.owned:
+            return
+        with owner_pid.get_lock():
+            if owner_pid.value == 0:
+                owner_pid.value = os.getpid()
+            elif owner_pid.value != os.getpid():
+                raise RuntimeError(
+                    f"Process {os.getpid()} cannot {side} audio: the queue is already used by process {owner_pid.value}, "
+                    "and only supports one producer process and one consumer process"
+                )
+        self.owned.add(side)
+
+    def store(self, data, dtype, shape):
+        nbytes = len(data)
+        if nbytes == 0 or nbytes > self.capacity - (
+            self.write_pos.value - self.read_pos.value
+        ):
+            return None
+        start = self.write_pos.value
+        offset = start % self.capacity
+        first = min(nbytes, self.capacity - offset)
+        self.view[offset : offset + first] = data[:first]
+        self.view[: nbytes - first] = data[first:]
+        self.write_pos.value = start + nbytes
+        return AudioRef(start, nbytes, dtype, shape)
+
+    def load(self, ref):
+        offset = ref.start % self.capacity
+        first = min(ref.nbytes, self.capacity - offset)
+        data = np.empty(ref.nbytes, dtype=np.uint8)
+        data[:first] = self.view[offset : offset + first]
+        data[first:] = self.view[: ref.nbytes - first]
+        # copied out, the producer can reuse this part of the ring
+        self.read_pos.value = ref.start + ref.nbytes
+        if ref.dtype is None:
+            return data.tobytes()
+        return data.view(ref.dtype).reshape(ref.shape)
+
+    def encode(self, audio):
+        if isinstance(audio, bytes):
+            ref = self.store(np.frombuffer(audio, dtype=np.uint8), None, None)
+        elif isinstance(audio, np.ndarray):
+            audio = np.ascontiguousarray(audio)
+            ref = self.store(audio.reshape(-1).view(np.uint8), audio.dtype.str, audio.shape)
+        else:
+            ref = None
+        return audio if ref is None else ref
+
+    def put(self, item, block=True, timeout=None):
+        self.claim("put", self.producer_pid)
+        with self.lock:
+            if isinstance(item, bytes) and item == b"END":
+                pass
+            elif isinstance(item, (bytes, np.ndarray)):
+                item = self.encode(item)
+            elif isinstance(getattr(item, "audio", None), np.ndarray):
+                item = copy.copy(item)
+                item.audio = self.encode(item.audio)
+            self.queue.put(item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        self.claim("get", self.consumer_pid)
+        item = self.queue.get(block, timeout)
+        if isinstance(item, AudioRef):
+            return self.load(item)
+        if isinstance(getattr(item, "audio", None), AudioRef):
+            item.audio = self.load(item.audio)
+        return item
+
+    def __getattr__(self, name):
+        # qsize, empty... of the underlying queue
+        if name == "queue":
+            # not set yet while unpickling
+            raise AttributeError(name)
+        return getattr(self.queue, name)
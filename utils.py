@@ -1,11 +1,63 @@
+import logging
+import multiprocessing
+import os
+
 import numpy as np
 import torch
 
+logger = logging.getLogger(__name__)
+
 
 def next_power_of_2(x):
     return 1 if x == 0 else 2 ** (x - 1).bit_length()
 
 
+def split_blocks(audio, blocksize):
+    """
+    Yields `audio` by blocks of `blocksize` samples, the last one being zero padded.
+    """
+    for i in range(0, len(audio), blocksize):
+        block = audio[i : i + blocksize]
+        yield np.pad(block, (0, blocksize - len(block)))
+
+
+def resolve_torch_dtype(torch_dtype, device):
+    """
+    Maps a dtype name to a torch dtype. 'auto' selects float32 on CPU, where half precision is slow or unsupported,
+    and float16 otherwise.
+    """
+    if torch_dtype == "auto":
+        torch_dtype = "float32" if device == "cpu" else "float16"
+    return getattr(torch, torch_dtype)
+
+
+def prepare_quantization(quantization, device, torch_dtype):
+    """
+    Validates the requested quantization and returns it along with the dtype the model should be loaded with.
+    """
+    if quantization is None:
+        return None, torch_dtype
+    if quantization != "int8":
+        raise ValueError(f"Unknown quantization {quantization}, should be 'int8'.")
+    if device != "cpu":
+        logger.warning(
+            "Dynamic int8 quantization is only supported on CPU. Running without quantization"
+        )
+        return None, torch_dtype
+    if torch_dtype != torch.float32:
+        logger.warning("Dynamic int8 quantization requires float32 weights. Loading the model in float32")
+    return quantization, torch.float32
+
+
+def quantize_dynamic_int8(model):
+    """
+    Replaces the linear layers of a float32 model with dynamically quantized int8 ones, for CPU inference.
+    """
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
 def int2float(sound):
     """
     Taken from https://github.com/snakers4/silero-vad
@@ -19,6 +71,174 @@ def int2float(sound):
     return sound
 
 
+class OutputSampleRate:
+    """
+    Playback sample rate negotiated with the connected client.
+    Shared between the socket sender, which sets it when a client announces its rate, and the TTS handlers, which read it
+    to decide whether their native output has to be resampled. The rate lives in shared memory so that it is also seen
+    by handlers running in their own process.
+    """
+
+    def __init__(self, default=16000):
+        self.default = default
+        self.value = multiprocessing.Value("i", default, lock=False)
+
+    def set(self, rate):
+        self.value.value = int(rate)
+
+    def get(self):
+        return self.value.value
+
+    def reset(self):
+        self.value.value = self.default
+
+
+class StageStatus:
+    """
+    Readiness of a pipeline stage, reported by the health server: `LOADING` while the handler loads its models,
+    `WARMING` while it warms them up, and `READY` once it is built. Lives in shared memory, like `OutputSampleRate`, so
+    that stages running in their own process report it too.
+    """
+
+    LOADING, WARMING, READY = range(3)
+    NAMES = ("loading", "warming", "ready")
+
+    def __init__(self):
+        self.value = multiprocessing.Value("i", self.LOADING, lock=False)
+
+    def set(self, state):
+        self.value.value = state
+
+    def get(self):
+        return self.value.value
+
+    def name(self):
+        return self.NAMES[self.get()]
+
+
+class ReplyProgress:
+    """
+    Text chunks of the replies yielded by the language model and spoken by the TTS, counted since the start. A reply
+    is spoken once the TTS has finished as many chunks as the language model had yielded with the last chunk of the
+    reply. Lives in shared memory, like `OutputSampleRate`, so that it is also seen by stages running in their own
+    process. Each count has a single writer.
+    """
+
+    def __init__(self):
+        self.sent = multiprocessing.Value("i", 0, lock=False)
+        self.spoken = multiprocessing.Value("i", 0, lock=False)
+
+    def chunk_sent(self):
+        """
+        Returns the number of chunks yielded so far, this one included.
+        """
+        self.sent.value += 1
+        return self.sent.value
+
+    def chunk_spoken(self):
+        self.spoken.value += 1
+
+    def spoken_up_to(self, nb_sent):
+        return self.spoken.value >= nb_sent
+
+
+class GenerationBudget:
+    """
+    Per call `max_new_tokens` derived from the size of the input, e.g. seconds of audio or characters of text:
+    `base_tokens + tokens_per_unit * size`, within [`min_new_tokens`, `max_new_tokens`].
+
+    Counts the calls where the budget was the reason generation stopped, which points at runaway generations or
+    at scale factors that are too tight.
+    """
+
+    def __init__(
+        self, name, tokens_per_unit, base_tokens, max_new_tokens, min_new_tokens=0
+    ):
+        self.name = name
+        self.tokens_per_unit = tokens_per_unit
+        self.base_tokens = base_tokens
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+        self.calls = 0
+        self.hits = 0
+
+    def __call__(self, size):
+        budget = int(self.base_tokens + self.tokens_per_unit * size)
+        return min(max(budget, self.min_new_tokens, 1), self.max_new_tokens)
+
+    def record(self, budget, hit):
+        self.calls += 1
+        if hit:
+            self.hits += 1
+            logger.info(
+                f"{self.name}: generation stopped by its budget of {budget} tokens, "
+                f"in {self.hits}/{self.calls} calls ({self.hits / self.calls:.0%}) so far"
+            )
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parses a CPU list in the taskset format, e.g. '0-3,8,10-11', into a set of CPU indices.
+    """
+    cpus = set()
+    for part in cpu_list.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+class CPUResources:
+    """
+    Thread budget and CPU affinity of a pipeline stage.
+
+    `apply` binds the calling thread to `cpu_affinity`, and sizes the torch intra-op and inter-op thread pools. Torch
+    pools are per process: when stages run as threads of one process, the last stage to apply its budget wins, and the
+    inter-op pool can only be sized before it is first used. Running stages in their own process, with `environment`
+    passed to the child, gives each stage its own pools, including the OpenMP and BLAS ones used by NumPy.
+    """
+
+    def __init__(self, num_threads=None, num_interop_threads=None, cpu_affinity=None):
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+        self.cpus = parse_cpu_list(cpu_affinity) if cpu_affinity else None
+
+    def environment(self):
+        """
+        Environment variables sizing the OpenMP and BLAS thread pools of a child process.
+        """
+        num_threads = self.num_threads or (len(self.cpus) if self.cpus else None)
+        if num_threads is None:
+            return {}
+        return {
+            name: str(num_threads)
+            for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+        }
+
+    def apply(self):
+        if self.cpus:
+            if hasattr(os, "sched_setaffinity"):
+                # on Linux, pid 0 targets the calling thread only
+                os.sched_setaffinity(0, self.cpus)
+            else:
+                logger.warning("CPU affinity is not supported on this platform. Ignoring it.")
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.num_interop_threads:
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError:
+                logger.warning(
+                    "The number of inter-op threads can only be set once per process, before any inter-op work. "
+                    "Use --stage_isolation process to give each stage its own pool."
+                )
+
+
 class VADIterator:
     def __init__(
         self,